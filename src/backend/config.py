@@ -1,3 +1,4 @@
+from typing import Literal
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -9,9 +10,90 @@ class Settings(BaseSettings):
         extra="ignore"
     )
 
-    openai_api_key: str
+    openai_api_key: str = ""
+    llm_model: str = "openai:gpt-4o-mini"
+    persona_models: dict[str, str] = {}
+    tone_model: str = "openai:gpt-4o-mini"
+    llm_max_concurrency: int = 16
+    llm_requests_per_second: float = 0.0
+    llm_max_retries: int = 3
+    llm_retry_base_delay: float = 0.5
+    llm_timeout_seconds: float = 60.0
+    llm_max_connections: int = 100
+    fake_latency_distribution: Literal["fixed", "uniform", "lognormal"] = "lognormal"
+    fake_latency_mean: float = 0.5
+    fake_latency_jitter: float = 0.25
+    fake_tokens_per_second: float = 40.0
+    fake_seed: int | None = None
     database_url: str = "sqlite+aiosqlite:///./ambient_chat.db"
+    database_profile: Literal["development", "production"] = "production"
+    database_pool_size: int = 5
+    database_read_pool_size: int = 10
+    database_max_overflow: int = 10
     cors_origins: list[str] = ["http://localhost:5173", "http://localhost:3000"]
+    stream_responses: bool = True
+    stream_debounce_seconds: float = 0.05
+    send_queue_size: int = 256
+    slow_client_policy: Literal["drop", "disconnect"] = "drop"
+    ws_max_connections: int = 10000
+    ws_max_room_connections: int = 500
+    ws_ping_interval: float = 20.0
+    ws_pong_timeout: float = 20.0
+    ws_idle_timeout: float = 3600.0
+    ws_max_message_size: int = 16384
+    broker_backend: Literal["memory", "sqlite"] = "memory"
+    broker_path: str = "./ambient_chat_broker.db"
+    broker_poll_interval: float = 0.02
+    broker_retention_seconds: float = 60.0
+    broker_worker_timeout: float = 10.0
+    history_buffer_size: int = 50
+    room_directory_cache_size: int = 256
+    room_directory_ttl_seconds: float = 5.0
+    prompt_history_tokens: int = 1500
+    prompt_message_tokens: int = 200
+    prompt_recent_messages: int = 8
+    prompt_block_size: int = 16
+    persona_file: str | None = None
+    persona_reload_interval: float = 2.0
+    tone_classifier: Literal["lexicon", "llm"] = "lexicon"
+    tone_confidence_threshold: float = 0.5
+    tone_llm_fallback: bool = True
+    tone_cache_size: int = 1024
+    tone_cache_ttl_seconds: float = 600.0
+    # Unset means sync with the sqlite broker and batched otherwise.
+    message_durability: Literal["sync", "batched"] | None = None
+    message_flush_interval: float = 0.05
+    message_flush_batch_size: int = 200
+    retention_max_messages: int = 0
+    retention_max_age_days: float = 0.0
+    retention_interval_seconds: float = 300.0
+    retention_batch_size: int = 2000
+    archive_path: str = "./ambient_chat_archive"
+    admission_user_rate: float = 1.0
+    admission_user_burst: float = 5.0
+    admission_room_rate: float = 5.0
+    admission_room_burst: float = 20.0
+    admission_max_llm_waiting: int = 64
+    admission_max_queued_replies: int = 256
+    coalesce_window_seconds: float = 0.75
+    round_reply_budget: int = 8
+    round_token_budget: int = 16000
+    process_tokens_per_minute: float = 0.0
+    max_followup_depth: int = 3
+    followup_delay_seconds: float = 0.5
+    response_cache_enabled: bool = False
+    response_cache_size: int = 2048
+    response_cache_ttl_seconds: float = 3600.0
+    response_cache_context_messages: int = 2
+    response_cache_persist: bool = False
+    speculative_generation: bool = False
+    speculation_width: int = 2
+    speculation_ttl_seconds: float = 30.0
+    room_generation_concurrency: int = 4
+    global_generation_concurrency: int = 16
+    metrics_enabled: bool = True
+    trace_log_path: str | None = None
+    loop_lag_interval: float = 0.25
 
 
 settings = Settings()
@@ -1,16 +1,32 @@
 import asyncio
+from collections.abc import AsyncIterator
 from datetime import datetime
-from fastapi import FastAPI, WebSocket, Depends, HTTPException
+from typing import Literal
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy import Row
 from backend.config import settings
-from backend.models.database import init_db, get_session, async_session_maker
-from backend.services.persona_engine import PersonaEngine
+from backend.models.database import init_db, async_session_maker, read_session_maker
+from backend.services.persona_engine import PersonaEngine, PromptBuilder, ResponseCache
 from backend.services.mystery_mode import MysteryModeEngine
+from backend.services.llm import LLMProvider, FakeModelFactory
 from backend.services.room_manager import RoomManager
-from backend.personas.definitions import get_persona_ids
+from backend.services.message_writer import MessageWriter
+from backend.services.archive import MessageArchive
+from backend.services.retention import RetentionManager
+from backend.services.room_hub import RoomHub
+from backend.services.broker import create_broker
+from backend.services.scheduler import ConversationScheduler
+from backend.services.speculation import Speculation, Speculator
+from backend.services.admission import AdmissionController, RoundCoalescer
+from backend.services.metrics import metrics, LoopLagMonitor, trace_id
+from backend.services.wire import available_codecs, negotiate
+from backend.services.payloads import CachedPayload
+from backend.services.cache import TTLCache
+from backend.personas.registry import PersonaSnapshot, registry as persona_registry
+from random import sample
 import json
-from typing import Set
 import uuid
 
 
@@ -22,54 +38,456 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Before-Id"],
 )
 
+llm = LLMProvider(
+    api_key=settings.openai_api_key,
+    max_concurrency=settings.llm_max_concurrency,
+    requests_per_second=settings.llm_requests_per_second,
+    max_retries=settings.llm_max_retries,
+    retry_base_delay=settings.llm_retry_base_delay,
+    timeout=settings.llm_timeout_seconds,
+    max_connections=settings.llm_max_connections,
+    fake_models=FakeModelFactory(
+        distribution=settings.fake_latency_distribution,
+        mean=settings.fake_latency_mean,
+        jitter=settings.fake_latency_jitter,
+        tokens_per_second=settings.fake_tokens_per_second,
+        seed=settings.fake_seed
+    )
+)
 persona_engine: PersonaEngine | None = None
 mystery_mode_engine: MysteryModeEngine | None = None
-room_manager = RoomManager()
+message_writer = MessageWriter(
+    async_session_maker,
+    durability=settings.message_durability or ("sync" if settings.broker_backend == "sqlite" else "batched"),
+    flush_interval=settings.message_flush_interval,
+    batch_size=settings.message_flush_batch_size
+)
+message_archive = MessageArchive(settings.archive_path)
+room_manager = RoomManager(
+    async_session_maker,
+    read_session_maker,
+    history_size=settings.history_buffer_size,
+    shared_history=settings.broker_backend == "sqlite",
+    writer=message_writer,
+    archive=message_archive
+)
+# Only other workers' room changes can make an entry stale; local ones bump the version.
+room_directory: TTLCache[CachedPayload] = TTLCache(
+    maxsize=settings.room_directory_cache_size,
+    ttl=settings.room_directory_ttl_seconds if settings.broker_backend == "sqlite" else None
+)
+retention = RetentionManager(
+    async_session_maker,
+    message_archive,
+    max_messages=settings.retention_max_messages,
+    max_age_days=settings.retention_max_age_days,
+    interval=settings.retention_interval_seconds,
+    batch_size=settings.retention_batch_size
+)
+
+room_hub = RoomHub(
+    max_queue_size=settings.send_queue_size,
+    slow_client_policy=settings.slow_client_policy,
+    max_connections=settings.ws_max_connections,
+    max_room_connections=settings.ws_max_room_connections,
+    ping_interval=settings.ws_ping_interval,
+    pong_timeout=settings.ws_pong_timeout,
+    idle_timeout=settings.ws_idle_timeout,
+    max_message_size=settings.ws_max_message_size
+)
+persona_registry.derive("wire_codecs", lambda snapshot: available_codecs(snapshot.names))
+broker = create_broker(
+    settings.broker_backend,
+    path=settings.broker_path,
+    poll_interval=settings.broker_poll_interval,
+    retention_seconds=settings.broker_retention_seconds,
+    worker_timeout=settings.broker_worker_timeout
+)
+
 
-active_connections: dict[int, Set[WebSocket]] = {}
-room_persona_tasks: dict[int, dict] = {}
+metrics.configure(enabled=settings.metrics_enabled, trace_log_path=settings.trace_log_path)
+loop_lag_monitor = LoopLagMonitor(metrics, interval=settings.loop_lag_interval)
+
+
+async def broadcast(room_id: int, payload: dict):
+    with metrics.span("broadcast", type=payload["type"]):
+        await broker.publish(room_id, json.dumps(payload))
 
 
 def get_persona_engine() -> PersonaEngine:
     global persona_engine
     if persona_engine is None:
-        persona_engine = PersonaEngine()
+        persona_engine = PersonaEngine(
+            llm,
+            model=settings.llm_model,
+            persona_models=settings.persona_models,
+            stream_debounce=settings.stream_debounce_seconds,
+            followup_delay=settings.followup_delay_seconds,
+            response_cache=ResponseCache(
+                maxsize=settings.response_cache_size,
+                ttl=settings.response_cache_ttl_seconds,
+                context_messages=settings.response_cache_context_messages,
+                session_maker=async_session_maker if settings.response_cache_persist else None
+            ) if settings.response_cache_enabled else None,
+            prompt_builder=PromptBuilder(
+                max_history_tokens=settings.prompt_history_tokens,
+                max_message_tokens=settings.prompt_message_tokens,
+                recent_messages=settings.prompt_recent_messages,
+                block_size=settings.prompt_block_size
+            ),
+            on_usage=lambda room_id, tokens: scheduler.charge(room_id, tokens)
+        )
     return persona_engine
 
 
+def build_persona_directory(snapshot: PersonaSnapshot) -> CachedPayload:
+    return CachedPayload({
+        persona_id: {
+            "name": persona.name,
+            "description": persona.description,
+            "knowledge_areas": persona.knowledge_areas,
+            "behavioral_modes": persona.behavioral_modes,
+            "response_style": persona.response_style
+        }
+        for persona_id, persona in snapshot.personas.items()
+    })
+
+
+persona_registry.derive("persona_directory", build_persona_directory)
+
+
 def get_mystery_mode_engine() -> MysteryModeEngine:
     global mystery_mode_engine
     if mystery_mode_engine is None:
-        mystery_mode_engine = MysteryModeEngine()
+        mystery_mode_engine = MysteryModeEngine(
+            llm,
+            model=settings.tone_model,
+            classifier=settings.tone_classifier,
+            confidence_threshold=settings.tone_confidence_threshold,
+            llm_fallback=settings.tone_llm_fallback,
+            cache_size=settings.tone_cache_size,
+            cache_ttl=settings.tone_cache_ttl_seconds
+        )
     return mystery_mode_engine
 
 
+async def save_persona_message(room_id: int, persona_id: str, content: str):
+    return await room_manager.save_message(room_id, "persona", persona_id, content)
+
+
+async def stream_persona_response(
+    room_id: int,
+    persona_id: str,
+    message_id: str,
+    deltas: AsyncIterator[str]
+) -> str:
+    persona_name = persona_engine.get_persona_info(persona_id).name
+    chunks: list[str] = []
+    async for delta in deltas:
+        if not chunks:
+            await broadcast(room_id, {
+                "type": "persona_message_start",
+                "message_id": message_id,
+                "persona_id": persona_id,
+                "persona_name": persona_name,
+                "sender_type": "persona",
+                "created_at": datetime.utcnow().isoformat()
+            })
+        chunks.append(delta)
+        await broadcast(room_id, {
+            "type": "persona_message_delta",
+            "message_id": message_id,
+            "persona_id": persona_id,
+            "delta": delta
+        })
+
+    response = "".join(chunks)
+    message = await save_persona_message(room_id, persona_id, response)
+
+    await broadcast(room_id, {
+        # Without a start frame clients have no bubble to finish, so send the whole message.
+        "type": "persona_message_end" if chunks else "persona_message",
+        "message_id": message_id,
+        "id": message.id,
+        "persona_id": persona_id,
+        "persona_name": persona_name,
+        "content": response,
+        "sender_type": "persona",
+        "created_at": message.created_at.isoformat()
+    })
+    return response
+
+
+async def cancel_persona_reply(room_id: int, persona_id: str, message_id: str, speculation: Speculation | None):
+    if speculation is not None:
+        speculation.cancel()
+    metrics.inc("persona_replies_total", outcome="cancelled")
+    await broadcast(room_id, {
+        "type": "persona_message_cancelled",
+        "message_id": message_id,
+        "persona_id": persona_id
+    })
+
+
+async def generate_and_send_response(room_id: int, persona_id: str, user_message: str, depth: int) -> bool:
+    message_id = uuid.uuid4().hex
+    speculation = speculator.claim(room_id, persona_id, user_message) if depth == 0 else None
+    try:
+        release_at = persona_engine.release_at(persona_id, depth)
+        await broadcast(room_id, {
+            "type": "persona_typing",
+            "message_id": message_id,
+            "persona_id": persona_id,
+            "persona_name": persona_engine.get_persona_info(persona_id).name
+        })
+
+        if speculation is None:
+            updated_history = await room_manager.get_conversation_history(
+                room_id, limit=settings.history_buffer_size
+            )
+        if settings.stream_responses:
+            if speculation is not None:
+                deltas = speculation.replay()
+            else:
+                deltas = persona_engine.stream_response(
+                    persona_id, user_message, updated_history, room_id, release_at
+                )
+            await stream_persona_response(room_id, persona_id, message_id, deltas)
+        else:
+            if speculation is not None:
+                response = await speculation.result()
+            else:
+                response = await persona_engine.generate_response(
+                    persona_id, user_message, updated_history, room_id, release_at
+                )
+            message = await save_persona_message(room_id, persona_id, response)
+
+            persona_msg_payload = {
+                "type": "persona_message",
+                "message_id": message_id,
+                "id": message.id,
+                "persona_id": persona_id,
+                "persona_name": persona_engine.get_persona_info(persona_id).name,
+                "content": response,
+                "sender_type": "persona",
+                "created_at": message.created_at.isoformat()
+            }
+            await broadcast(room_id, persona_msg_payload)
+        metrics.inc("persona_replies_total", outcome="ok")
+        return True
+
+    except asyncio.CancelledError:
+        await cancel_persona_reply(room_id, persona_id, message_id, speculation)
+        raise
+    except Exception as e:
+        if asyncio.current_task().cancelling():
+            # Cancelling a model stream can surface as an anyio or async generator
+            # error instead of CancelledError.
+            await cancel_persona_reply(room_id, persona_id, message_id, speculation)
+            raise asyncio.CancelledError from e
+        metrics.inc("persona_replies_total", outcome="error")
+        metrics.inc("errors_total", kind="generation")
+        error_payload = {
+            "type": "error",
+            "message_id": message_id,
+            "message": f"Error generating response from {persona_id}: {str(e)}"
+        }
+        await broadcast(room_id, error_payload)
+        return False
+
+
+scheduler = ConversationScheduler(
+    generate_and_send_response,
+    lambda: persona_registry.ids,
+    broker.room_active,
+    round_budget=settings.round_reply_budget,
+    round_token_budget=settings.round_token_budget,
+    process_tokens_per_minute=settings.process_tokens_per_minute,
+    max_depth=settings.max_followup_depth,
+    per_room_concurrency=settings.room_generation_concurrency,
+    global_concurrency=settings.global_generation_concurrency
+)
+
+admission = AdmissionController(
+    user_rate=settings.admission_user_rate,
+    user_burst=settings.admission_user_burst,
+    room_rate=settings.admission_room_rate,
+    room_burst=settings.admission_room_burst,
+    overloaded=lambda: (
+        0 < settings.admission_max_llm_waiting <= llm.waiting()
+        or 0 < settings.admission_max_queued_replies <= scheduler.queue_depth()
+    )
+)
+
+
+async def submit_persona_round(room_id: int, user_message: str, mystery_mode: bool):
+    await broker.submit(room_id, {
+        "kind": "persona_round",
+        "user_message": user_message,
+        "mystery_mode": mystery_mode
+    })
+
+
+coalescer = RoundCoalescer(submit_persona_round, window=settings.coalesce_window_seconds)
+
+metrics.collect("active_rooms", "gauge", lambda: len(room_hub.rooms), "Rooms with at least one local connection")
+metrics.collect("connections", "gauge", room_hub.connection_count, "Open websocket connections")
+metrics.collect("send_queue_depth", "gauge", lambda: sum(room_hub.queue_depths().values()), "Frames queued for sending")
+metrics.collect("persona_tasks_in_flight", "gauge", scheduler.in_flight, "Persona replies being generated")
+metrics.collect("persona_tasks_queued", "gauge", scheduler.queue_depth, "Persona replies waiting for a slot")
+metrics.collect("pending_message_writes", "gauge", lambda: len(message_writer.pending), "Messages not yet flushed")
+metrics.collect("event_loop_lag_last_seconds", "gauge", lambda: loop_lag_monitor.last_lag, "Most recent event loop lag sample")
+metrics.collect("dropped_sends_total", "counter", lambda: room_hub.dropped_sends, "Frames dropped for slow clients")
+metrics.collect(
+    "slow_client_disconnects_total", "counter", lambda: room_hub.disconnected_slow_clients,
+    "Connections closed for falling behind"
+)
+metrics.collect("tone_cache_size", "gauge", lambda: get_mystery_mode_engine().tone_cache.stats()["size"], "Cached tones")
+for stat, help_text in (
+    ("hits", "Tone lookups served from the cache"),
+    ("misses", "Tone lookups that needed a classifier"),
+    ("evictions", "Cached tones evicted to stay under the size limit"),
+):
+    metrics.collect(
+        f"tone_cache_{stat}_total", "counter",
+        lambda stat=stat: get_mystery_mode_engine().tone_cache.stats()[stat], help_text
+    )
+metrics.collect(
+    "tone_fallback_calls_total", "counter",
+    lambda: getattr(get_mystery_mode_engine().tone_classifier, "fallback_calls", 0),
+    "Messages the lexicon was unsure about and sent to the LLM classifier"
+)
+
+
+speculator = Speculator(
+    count_tokens=lambda text: persona_engine.prompt_builder.counter.count(text),
+    ttl=settings.speculation_ttl_seconds
+)
+
+
+async def speculate(room_id: int, user_message: str, persona_ids: list[str]):
+    try:
+        history = await room_manager.get_conversation_history(
+            room_id, limit=settings.history_buffer_size
+        )
+        prompt_tokens = persona_engine.prompt_tokens(user_message, history, room_id)
+        for persona_id in persona_ids:
+            release_at = persona_engine.release_at(persona_id)
+            speculator.start(
+                room_id, persona_id, user_message, prompt_tokens,
+                lambda persona_id=persona_id, release_at=release_at: persona_engine.stream_response(
+                    persona_id, user_message, history, room_id, release_at
+                )
+            )
+    except Exception as e:
+        metrics.inc("errors_total", kind="speculation")
+        print(f"Speculation error: {e}")
+
+
+async def run_persona_round(room_id: int, task: dict):
+    try:
+        await start_persona_round(room_id, task)
+    except Exception as e:
+        metrics.inc("errors_total", kind="persona_round")
+        print(f"Persona round error: {e}")
+        await broadcast(room_id, {
+            "type": "error",
+            "message": f"Could not start persona replies: {e}"
+        })
+
+
+async def start_persona_round(room_id: int, task: dict):
+    user_message = task["user_message"]
+    if task["mystery_mode"]:
+        selection = mystery_mode_engine.select_responding_personas(user_message, num_responses=3)
+        likely = (
+            mystery_mode_engine.likely_personas(user_message, settings.speculation_width)
+            if settings.speculative_generation else []
+        )
+        if likely:
+            try:
+                _, responding_personas = await asyncio.gather(
+                    speculate(room_id, user_message, likely), selection
+                )
+            except BaseException:
+                speculator.cancel_room(room_id)
+                raise
+        else:
+            responding_personas = await selection
+    else:
+        all_personas = persona_registry.ids
+        responding_personas = sample(all_personas, min(4, len(all_personas)))
+
+    scheduled = scheduler.start_round(room_id, user_message, responding_personas)
+    speculator.resolve(room_id, user_message, scheduled)
+
+
 @app.on_event("startup")
 async def startup():
+    if settings.broker_backend == "sqlite" and message_writer.durability == "batched":
+        raise RuntimeError("MESSAGE_DURABILITY=batched needs a single writer; use sync with the sqlite broker")
+    if settings.persona_file:
+        persona_registry.watch(settings.persona_file)
+        persona_registry.start(settings.persona_reload_interval)
     await init_db()
-    get_persona_engine()
+    await message_writer.start()
+    retention.start()
+    engine = get_persona_engine()
+    if engine.response_cache is not None:
+        await engine.response_cache.load()
     get_mystery_mode_engine()
+    loop_lag_monitor.start()
+    await broker.start(room_hub.broadcast_raw, run_persona_round)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await scheduler.close()
+    await speculator.close()
+    await coalescer.close()
+    if persona_engine is not None and persona_engine.response_cache is not None:
+        await persona_engine.response_cache.close()
+    await broker.stop()
+    await room_hub.close()
+    await retention.stop()
+    await message_writer.stop()
+    await llm.close()
+    await loop_lag_monitor.stop()
+    await persona_registry.stop()
 
 
 @app.get("/rooms")
-async def list_rooms(session: AsyncSession = Depends(get_session)):
-    rooms = await room_manager.get_all_rooms(session)
-    return [
-        {
-            "id": room.id,
-            "name": room.name,
-            "mystery_mode": room.mystery_mode,
-            "created_at": room.created_at.isoformat()
-        }
-        for room in rooms
-    ]
+async def list_rooms(
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000),
+    before_id: int | None = None
+):
+    key = (room_manager.directory_version, limit, before_id)
+    payload = room_directory.get(key)
+    if payload is None:
+        rooms = await room_manager.get_room_page(limit, before_id)
+        payload = CachedPayload(
+            [
+                {
+                    "id": room.id,
+                    "name": room.name,
+                    "mystery_mode": room.mystery_mode,
+                    "created_at": room.created_at.isoformat()
+                }
+                for room in rooms
+            ],
+            headers={"X-Next-Before-Id": str(rooms[-1].id)} if len(rooms) == limit else None
+        )
+        room_directory.set(key, payload)
+    return payload.response(request)
 
 
 @app.post("/rooms")
-async def create_room(name: str, mystery_mode: bool = False, session: AsyncSession = Depends(get_session)):
-    room = await room_manager.create_room(session, name, mystery_mode)
+async def create_room(name: str, mystery_mode: bool = False):
+    room = await room_manager.create_room(name, mystery_mode)
     return {
         "id": room.id,
         "name": room.name,
@@ -78,77 +496,98 @@ async def create_room(name: str, mystery_mode: bool = False, session: AsyncSessi
     }
 
 
+def message_row_to_dict(row: Row, persona_names: dict[str, str]) -> dict:
+    message_dict = {
+        "id": row.id,
+        "type": f"{row.sender_type}_message",
+        "content": row.content,
+        "sender_type": row.sender_type,
+        "created_at": row.created_at.isoformat()
+    }
+
+    if row.sender_type == "user":
+        message_dict["user_id"] = row.sender_id
+    elif row.sender_type == "persona":
+        message_dict["persona_id"] = row.sender_id
+        message_dict["persona_name"] = persona_names.get(row.sender_id, row.sender_id)
+
+    return message_dict
+
+
 @app.get("/rooms/{room_id}/messages")
-async def get_messages(room_id: int, session: AsyncSession = Depends(get_session)):
-    messages = await room_manager.get_room_messages(session, room_id)
-    engine = get_persona_engine()
-    result = []
-    for msg in messages:
-        message_dict = {
-            "id": msg.id,
-            "type": f"{msg.sender_type}_message",
-            "content": msg.content,
-            "sender_type": msg.sender_type,
-            "created_at": msg.created_at.isoformat()
-        }
+async def get_messages(
+    room_id: int,
+    before_id: int | None = None,
+    after_id: int | None = None,
+    limit: int = Query(100, ge=1, le=5000),
+    format: Literal["json", "ndjson"] = "json"
+):
+    persona_names = persona_registry.snapshot.names
+
+    if format == "ndjson":
+        async def ndjson_lines():
+            rows = room_manager.stream_message_page(
+                room_id, before_id=before_id, after_id=after_id, limit=limit
+            )
+            async for row in rows:
+                yield json.dumps(message_row_to_dict(row, persona_names)) + "\n"
 
-        if msg.sender_type == "user":
-            message_dict["user_id"] = msg.sender_id
-        elif msg.sender_type == "persona":
-            message_dict["persona_id"] = msg.sender_id
-            try:
-                persona = engine.get_persona_info(msg.sender_id)
-                message_dict["persona_name"] = persona.name
-            except:
-                message_dict["persona_name"] = msg.sender_id
+        return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
 
-        result.append(message_dict)
+    rows = await room_manager.get_message_page(
+        room_id, before_id=before_id, after_id=after_id, limit=limit
+    )
+    return [message_row_to_dict(row, persona_names) for row in rows]
 
-    return result
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/personas")
-async def list_personas():
-    engine = get_persona_engine()
-    personas = engine.get_all_persona_info()
-    return {
-        persona_id: {
-            "name": persona.name,
-            "description": persona.description,
-            "knowledge_areas": persona.knowledge_areas,
-            "behavioral_modes": persona.behavioral_modes,
-            "response_style": persona.response_style
-        }
-        for persona_id, persona in personas.items()
-    }
+async def list_personas(request: Request):
+    return persona_registry.derived("persona_directory").response(request)
 
 
 @app.websocket("/ws/rooms/{room_id}")
 async def websocket_endpoint(websocket: WebSocket, room_id: int):
-    await websocket.accept()
-
-    if room_id not in active_connections:
-        active_connections[room_id] = set()
-    active_connections[room_id].add(websocket)
-
-    session = async_session_maker()
-    room = await room_manager.get_room(session, room_id)
+    codec = negotiate(websocket.scope.get("subprotocols", []), persona_registry.derived("wire_codecs"))
+    await websocket.accept(subprotocol=codec.subprotocol)
 
+    room = await room_manager.get_room(room_id)
     if not room:
         await websocket.close(code=1008, reason="Room not found")
         return
 
+    rejection = room_hub.admission_error(room_id)
+    if rejection:
+        metrics.inc("connections_rejected_total", reason=rejection.lower().replace(" ", "_"))
+        await websocket.close(code=1013, reason=rejection)
+        return
+
+    connection = room_hub.join(room_id, websocket, codec)
+    # Rate limits and coalescing key on the socket, not on the user_id the client claims.
+    connection_id = str(uuid.uuid4())
     try:
-        while True:
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
+        await broker.join_room(room_id)
+        while (message_data := await connection.receive()) is not None:
+            trace_id.set(uuid.uuid4().hex[:16])
 
-            user_id = message_data.get("user_id", str(uuid.uuid4()))
+            user_id = message_data.get("user_id") or connection_id
             user_message = message_data.get("message", "")
 
-            await room_manager.save_message(
-                session, room_id, "user", user_id, user_message
-            )
+            throttle = admission.check(room_id, connection_id)
+            if throttle and throttle.drop:
+                connection.send({
+                    "type": "throttled",
+                    "reason": throttle.reason,
+                    "retry_after": round(throttle.retry_after, 3),
+                    "content": user_message
+                })
+                continue
+
+            await room_manager.save_message(room_id, "user", user_id, user_message)
 
             user_msg_payload = {
                 "type": "user_message",
@@ -157,75 +596,26 @@ async def websocket_endpoint(websocket: WebSocket, room_id: int):
                 "sender_type": "user"
             }
 
-            for connection in active_connections[room_id]:
-                await connection.send_text(json.dumps(user_msg_payload))
+            await broadcast(room_id, user_msg_payload)
 
-            conversation_history = await room_manager.get_conversation_history(session, room_id, limit=20)
-
-            if room.mystery_mode:
-                responding_personas = await mystery_mode_engine.select_responding_personas(
-                    user_message, num_responses=3
-                )
+            if throttle:
+                connection.send({
+                    "type": "throttled",
+                    "reason": throttle.reason,
+                    "retry_after": round(throttle.retry_after, 3)
+                })
             else:
-                from random import sample
-                all_personas = get_persona_ids()
-                responding_personas = sample(all_personas, min(4, len(all_personas)))
-
-            async def generate_and_send_response(persona_id: str, depth: int = 0, max_depth: int = 3):
-                try:
-                    updated_history = await room_manager.get_conversation_history(session, room_id, limit=20)
-                    response = await persona_engine.generate_response(
-                        persona_id, user_message, updated_history
-                    )
-
-                    await room_manager.save_message(
-                        session, room_id, "persona", persona_id, response
-                    )
-
-                    persona_msg_payload = {
-                        "type": "persona_message",
-                        "persona_id": persona_id,
-                        "persona_name": persona_engine.get_persona_info(persona_id).name,
-                        "content": response,
-                        "sender_type": "persona",
-                        "created_at": datetime.utcnow().isoformat()
-                    }
-
-                    for connection in active_connections[room_id]:
-                        try:
-                            await connection.send_text(json.dumps(persona_msg_payload))
-                        except Exception:
-                            pass
-
-                    if depth < max_depth and len(updated_history) >= 2:
-                        await asyncio.sleep(0.5)
-
-                        available_personas = [p for p in get_persona_ids() if p != persona_id]
-                        if available_personas:
-                            from random import choice, sample, random
-                            num_followups = 1 if depth > 0 else 2
-                            selected = sample(available_personas, min(num_followups, len(available_personas)))
-                            for followup_persona in selected:
-                                asyncio.create_task(generate_and_send_response(followup_persona, depth=depth + 1, max_depth=max_depth))
-
-                except Exception as e:
-                    error_payload = {
-                        "type": "error",
-                        "message": f"Error generating response from {persona_id}: {str(e)}"
-                    }
-                    for connection in active_connections[room_id]:
-                        try:
-                            await connection.send_text(json.dumps(error_payload))
-                        except Exception:
-                            pass
-
-            tasks = [generate_and_send_response(persona_id) for persona_id in responding_personas]
-            asyncio.create_task(asyncio.gather(*tasks))
+                await coalescer.add(room_id, connection_id, user_message, room.mystery_mode)
 
+    except WebSocketDisconnect:
+        pass
     except Exception as e:
+        metrics.inc("errors_total", kind="websocket")
         print(f"WebSocket error: {e}")
     finally:
-        active_connections[room_id].discard(websocket)
-        if not active_connections[room_id]:
-            del active_connections[room_id]
-        await session.close()
+        await room_hub.leave(connection)
+        if not await broker.leave_room(room_id):
+            scheduler.cancel_room(room_id)
+            speculator.cancel_room(room_id)
+            coalescer.cancel_room(room_id)
+            room_manager.forget_history(room_id)
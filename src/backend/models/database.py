@@ -1,6 +1,8 @@
 from datetime import datetime
-from sqlalchemy import DateTime, String, Text, ForeignKey, Boolean
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy import DateTime, String, Text, ForeignKey, Boolean, Index, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from backend.config import settings
 
@@ -11,17 +13,26 @@ class Base(DeclarativeBase):
 
 class Room(Base):
     __tablename__ = "rooms"
+    __table_args__ = (
+        Index("ix_rooms_created_at", "created_at"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(100))
     mystery_mode: Mapped[bool] = mapped_column(Boolean, default=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
-    messages: Mapped[list["Message"]] = relationship(back_populates="room", cascade="all, delete-orphan")
+    messages: Mapped[list["Message"]] = relationship(
+        back_populates="room", cascade="all, delete-orphan", passive_deletes=True
+    )
 
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_room_id_created_at", "room_id", "created_at"),
+        Index("ix_messages_room_id_id", "room_id", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     room_id: Mapped[int] = mapped_column(ForeignKey("rooms.id", ondelete="CASCADE"))
@@ -33,15 +44,96 @@ class Message(Base):
     room: Mapped["Room"] = relationship(back_populates="messages")
 
 
-engine = create_async_engine(settings.database_url, echo=True)
-async_session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+class CachedResponse(Base):
+    __tablename__ = "response_cache"
+    __table_args__ = (
+        Index("ix_response_cache_created_at", "created_at"),
+    )
 
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    persona_id: Mapped[str] = mapped_column(String(100))
+    content: Mapped[str] = mapped_column(Text)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
-async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
 
+PRODUCTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA foreign_keys=ON",
+)
+
+
+def _is_file_sqlite(url: str) -> bool:
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and parsed.database not in (None, "", ":memory:")
+
+
+def create_engine_for_profile(
+    url: str,
+    profile: str = "production",
+    read_only: bool = False,
+    pool_size: int = 5,
+    max_overflow: int = 10
+) -> AsyncEngine:
+    if profile == "development":
+        return create_async_engine(url, echo=True)
+
+    options = {}
+    if _is_file_sqlite(url) or make_url(url).get_backend_name() != "sqlite":
+        options.update(pool_size=pool_size, max_overflow=max_overflow)
+    async_engine = create_async_engine(url, echo=False, **options)
+
+    if make_url(url).get_backend_name() == "sqlite":
+        @event.listens_for(async_engine.sync_engine, "connect")
+        def apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            if not read_only:
+                cursor.execute("PRAGMA journal_mode=WAL")
+            for pragma in PRODUCTION_PRAGMAS:
+                cursor.execute(pragma)
+            if read_only:
+                cursor.execute("PRAGMA query_only=ON")
+            cursor.close()
+
+    return async_engine
+
+
+engine = create_engine_for_profile(
+    settings.database_url,
+    settings.database_profile,
+    pool_size=settings.database_pool_size,
+    max_overflow=settings.database_max_overflow
+)
+async_session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
-async def get_session() -> AsyncSession:
-    async with async_session_maker() as session:
-        yield session
+read_engine = create_engine_for_profile(
+    settings.database_url,
+    settings.database_profile,
+    read_only=True,
+    pool_size=settings.database_read_pool_size,
+    max_overflow=settings.database_max_overflow
+) if _is_file_sqlite(settings.database_url) else engine
+read_session_maker = async_sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+
+
+def _create_indexes(conn):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+async def init_db(attempts: int = 3):
+    for attempt in range(attempts):
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+                await conn.run_sync(_create_indexes)
+            return
+        except (OperationalError, ProgrammingError) as e:
+            # Workers starting together race between checking for a table and
+            # creating it; the loser retries and finds everything in place.
+            if "already exists" not in str(e) or attempt == attempts - 1:
+                raise
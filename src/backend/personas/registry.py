@@ -0,0 +1,121 @@
+import asyncio
+import json
+import os
+from collections.abc import Callable
+from backend.personas.definitions import PERSONAS, TONE_PERSONAS, PersonaTrait
+from backend.services.metrics import metrics
+
+
+class PersonaSnapshot:
+    """One immutable generation of persona definitions and everything derived from them."""
+
+    __slots__ = ("version", "personas", "tone_personas", "ids", "index", "names", "derived")
+
+    def __init__(self, version: int, personas: dict[str, PersonaTrait], tone_personas: dict[str, tuple[str, ...]]):
+        unknown = {
+            persona_id
+            for persona_ids in tone_personas.values()
+            for persona_id in persona_ids
+            if persona_id not in personas
+        }
+        if unknown:
+            raise ValueError(f"Tone routes reference unknown personas: {', '.join(sorted(unknown))}")
+        self.version = version
+        self.personas = personas
+        self.tone_personas = tone_personas
+        self.ids = tuple(personas)
+        self.index = {persona_id: index for index, persona_id in enumerate(self.ids)}
+        self.names = {persona_id: persona.name for persona_id, persona in personas.items()}
+        self.derived: dict[str, object] = {}
+
+
+class PersonaRegistry:
+    """Holds the current persona snapshot and swaps it as a whole.
+
+    Structures built from the personas (routing tables, serialized payloads,
+    wire codecs) are registered with ``derive`` and rebuilt for every new
+    snapshot before it is published, so readers never see a mix of old and
+    new. With a ``path``, ``start`` polls the file and reloads it on change.
+    """
+
+    def __init__(self, personas: dict[str, PersonaTrait], tone_personas: dict[str, list[str]]):
+        self.builders: dict[str, Callable[[PersonaSnapshot], object]] = {}
+        self.snapshot = PersonaSnapshot(
+            1, dict(personas), {tone: tuple(ids) for tone, ids in tone_personas.items()}
+        )
+        self.path: str | None = None
+        self.mtime: float | None = None
+        self.task: asyncio.Task | None = None
+
+    @property
+    def ids(self) -> tuple[str, ...]:
+        return self.snapshot.ids
+
+    def get(self, persona_id: str) -> PersonaTrait:
+        return self.snapshot.personas[persona_id]
+
+    def all(self) -> dict[str, PersonaTrait]:
+        return self.snapshot.personas
+
+    def derived(self, name: str):
+        return self.snapshot.derived[name]
+
+    def derive(self, name: str, builder: Callable[[PersonaSnapshot], object]):
+        self.snapshot.derived[name] = builder(self.snapshot)
+        self.builders[name] = builder
+
+    def replace(self, personas: dict[str, PersonaTrait], tone_personas: dict[str, list[str]] | None = None):
+        routes = self.snapshot.tone_personas if tone_personas is None else {
+            tone: tuple(ids) for tone, ids in tone_personas.items()
+        }
+        snapshot = PersonaSnapshot(self.snapshot.version + 1, dict(personas), routes)
+        for name, builder in self.builders.items():
+            snapshot.derived[name] = builder(snapshot)
+        self.snapshot = snapshot
+
+    def load(self, path: str):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        self.replace(
+            {persona_id: PersonaTrait.from_dict(persona) for persona_id, persona in data["personas"].items()},
+            data.get("tone_personas")
+        )
+
+    def reload_if_changed(self) -> bool:
+        mtime = os.stat(self.path).st_mtime
+        if mtime == self.mtime:
+            return False
+        # Recorded before loading so a broken file is retried only once it changes again.
+        self.mtime = mtime
+        self.load(self.path)
+        return True
+
+    def watch(self, path: str):
+        self.path = path
+        self.reload_if_changed()
+
+    def start(self, interval: float = 2.0):
+        if self.path and interval > 0:
+            self.task = asyncio.create_task(self._run(interval))
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def _run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if self.reload_if_changed():
+                    print(f"Reloaded personas from {self.path} (version {self.snapshot.version})")
+            except Exception as e:
+                metrics.inc("errors_total", kind="persona_reload")
+                print(f"Persona reload error: {e}")
+
+
+registry = PersonaRegistry(PERSONAS, TONE_PERSONAS)
@@ -0,0 +1,143 @@
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+from typing import NamedTuple
+from backend.services.cache import TTLCache
+from backend.services.metrics import metrics
+
+
+SubmitFn = Callable[[int, str, bool], Awaitable[None]]
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated_at")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def retry_after(self) -> float:
+        """Seconds until a token is available, without taking one."""
+        self._refill()
+        return 0.0 if self.tokens >= 1.0 else (1.0 - self.tokens) / self.rate
+
+    def take(self, count: float = 1.0):
+        self._refill()
+        self.tokens -= count
+
+
+class Throttle(NamedTuple):
+    reason: str
+    retry_after: float
+    drop: bool
+
+
+class AdmissionController:
+    """Decides whether an inbound user message may go through.
+
+    Messages beyond a sender's or a room's token bucket are dropped. Senders
+    are keyed by connection, since a client can claim any user id. When the
+    node is overloaded the message is still kept but starts no persona round.
+    Buckets are only charged for admitted messages, so a throttled client does
+    not dig itself deeper.
+    """
+
+    def __init__(
+        self,
+        user_rate: float = 1.0,
+        user_burst: float = 5.0,
+        room_rate: float = 5.0,
+        room_burst: float = 20.0,
+        overloaded: Callable[[], bool] = lambda: False,
+        max_tracked: int = 10000
+    ):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.room_rate = room_rate
+        self.room_burst = room_burst
+        self.overloaded = overloaded
+        self.users: TTLCache[TokenBucket] = TTLCache(maxsize=max_tracked, ttl=None)
+        self.rooms: TTLCache[TokenBucket] = TTLCache(maxsize=max_tracked, ttl=None)
+
+    def _bucket(self, buckets: TTLCache[TokenBucket], key, rate: float, burst: float) -> TokenBucket | None:
+        if rate <= 0:
+            return None
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(rate, burst)
+            buckets.set(key, bucket)
+        return bucket
+
+    def check(self, room_id: int, sender: str) -> Throttle | None:
+        user = self._bucket(self.users, sender, self.user_rate, self.user_burst)
+        room = self._bucket(self.rooms, room_id, self.room_rate, self.room_burst)
+        for reason, bucket in (("user_rate", user), ("room_rate", room)):
+            if bucket is not None and (wait := bucket.retry_after()) > 0:
+                metrics.inc("messages_throttled_total", reason=reason)
+                return Throttle(reason, wait, drop=True)
+
+        for bucket in (user, room):
+            if bucket is not None:
+                bucket.take()
+        if self.overloaded():
+            metrics.inc("messages_throttled_total", reason="overloaded")
+            return Throttle("overloaded", 1.0, drop=False)
+        return None
+
+
+class RoundCoalescer:
+    """Turns a burst of messages from one sender into a single persona round.
+
+    The first message after a quiet period starts its round at once. Messages
+    from the same sender within ``window`` after that are held and submitted
+    together as one round when the window closes.
+    """
+
+    def __init__(self, submit: SubmitFn, window: float = 0.75):
+        self.submit = submit
+        self.window = window
+        self.held: dict[tuple[int, str], list[str]] = {}
+        self.timers: dict[tuple[int, str], asyncio.Task] = {}
+
+    async def add(self, room_id: int, sender: str, user_message: str, mystery_mode: bool):
+        key = (room_id, sender)
+        if key in self.timers:
+            self.held.setdefault(key, []).append(user_message)
+            metrics.inc("messages_coalesced_total")
+            return
+        if self.window > 0:
+            self.timers[key] = asyncio.create_task(self._close_window(key, mystery_mode))
+        await self.submit(room_id, user_message, mystery_mode)
+
+    async def _close_window(self, key: tuple[int, str], mystery_mode: bool):
+        await asyncio.sleep(self.window)
+        del self.timers[key]
+        held = self.held.pop(key, None)
+        if not held:
+            return
+        self.timers[key] = asyncio.create_task(self._close_window(key, mystery_mode))
+        try:
+            await self.submit(key[0], "\n".join(held), mystery_mode)
+        except Exception as e:
+            metrics.inc("errors_total", kind="coalescer")
+            print(f"Coalesced round error: {e}")
+
+    def cancel_room(self, room_id: int):
+        for key in [key for key in self.timers if key[0] == room_id]:
+            self.timers.pop(key).cancel()
+            self.held.pop(key, None)
+
+    async def close(self):
+        timers = list(self.timers.values())
+        self.timers.clear()
+        self.held.clear()
+        for timer in timers:
+            timer.cancel()
+        await asyncio.gather(*timers, return_exceptions=True)
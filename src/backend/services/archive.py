@@ -0,0 +1,140 @@
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+from typing import NamedTuple
+from backend.services.cache import TTLCache
+
+
+class ArchivedMessage(NamedTuple):
+    id: int
+    sender_type: str
+    sender_id: str
+    content: str
+    created_at: datetime
+
+
+class Segment(NamedTuple):
+    first_id: int
+    last_id: int
+    path: str
+
+
+class MessageArchive:
+    """Stores compacted messages as immutable gzip NDJSON segments per room.
+
+    Each segment is named after the id range it holds, so readers can skip
+    segments that cannot overlap a page. Segments are written to a temporary
+    file and renamed into place, so a reader never sees a partial one.
+    """
+
+    def __init__(self, path: str, cache_segments: int = 16):
+        self.path = path
+        self.decoded: TTLCache[list[ArchivedMessage]] = TTLCache(maxsize=cache_segments, ttl=None)
+        self.decoded_lock = threading.Lock()
+
+    def _room_dir(self, room_id: int) -> str:
+        return os.path.join(self.path, f"room_{room_id}")
+
+    def has_room(self, room_id: int) -> bool:
+        return os.path.isdir(self._room_dir(room_id))
+
+    def segments(self, room_id: int) -> list[Segment]:
+        room_dir = self._room_dir(room_id)
+        try:
+            names = os.listdir(room_dir)
+        except FileNotFoundError:
+            return []
+        segments = []
+        for name in names:
+            if not name.endswith(".ndjson.gz"):
+                continue
+            first, _, last = name.removesuffix(".ndjson.gz").partition("-")
+            segments.append(Segment(int(first), int(last), os.path.join(room_dir, name)))
+        return sorted(segments)
+
+    def max_id(self, room_id: int) -> int | None:
+        segments = self.segments(room_id)
+        return segments[-1].last_id if segments else None
+
+    def _write_segment(self, room_id: int, rows: list[dict]) -> Segment:
+        room_dir = self._room_dir(room_id)
+        os.makedirs(room_dir, exist_ok=True)
+        first_id, last_id = rows[0]["id"], rows[-1]["id"]
+        path = os.path.join(room_dir, f"{first_id:012d}-{last_id:012d}.ndjson.gz")
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps({**row, "created_at": row["created_at"].isoformat()}) + "\n")
+        os.replace(tmp_path, path)
+        return Segment(first_id, last_id, path)
+
+    async def write_segment(self, room_id: int, rows: list[dict]) -> Segment:
+        return await asyncio.to_thread(self._write_segment, room_id, rows)
+
+    def _load(self, segment: Segment) -> list[ArchivedMessage]:
+        with self.decoded_lock:
+            rows = self.decoded.get(segment.path)
+        if rows is not None:
+            return rows
+        with gzip.open(segment.path, "rt", encoding="utf-8") as f:
+            rows = [
+                ArchivedMessage(
+                    row["id"], row["sender_type"], row["sender_id"], row["content"],
+                    datetime.fromisoformat(row["created_at"])
+                )
+                for row in map(json.loads, f)
+            ]
+        with self.decoded_lock:
+            self.decoded.set(segment.path, rows)
+        return rows
+
+    def _read(
+        self,
+        room_id: int,
+        before_id: int | None,
+        after_id: int | None,
+        limit: int,
+        newest: bool
+    ) -> list[ArchivedMessage]:
+        segments = [
+            segment for segment in self.segments(room_id)
+            if (before_id is None or segment.first_id < before_id)
+            and (after_id is None or segment.last_id > after_id)
+        ]
+        picked: list[ArchivedMessage] = []
+        for segment in reversed(segments) if newest else segments:
+            rows = [
+                row for row in self._load(segment)
+                if (before_id is None or row.id < before_id) and (after_id is None or row.id > after_id)
+            ]
+            if newest:
+                picked = rows[-(limit - len(picked)):] + picked
+            else:
+                picked.extend(rows[:limit - len(picked)])
+            if len(picked) >= limit:
+                break
+        return picked
+
+    async def read(
+        self,
+        room_id: int,
+        before_id: int | None = None,
+        after_id: int | None = None,
+        limit: int = 100,
+        newest: bool = True
+    ) -> list[ArchivedMessage]:
+        if limit <= 0 or not self.has_room(room_id):
+            return []
+        return await asyncio.to_thread(self._read, room_id, before_id, after_id, limit, newest)
+
+    def _delete_room(self, room_id: int):
+        shutil.rmtree(self._room_dir(room_id), ignore_errors=True)
+        with self.decoded_lock:
+            self.decoded.clear()
+
+    async def delete_room(self, room_id: int):
+        await asyncio.to_thread(self._delete_room, room_id)
@@ -0,0 +1,313 @@
+import asyncio
+import json
+import sqlite3
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections.abc import Awaitable, Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Literal
+from backend.services.metrics import metrics
+
+
+FrameHandler = Callable[[int, str], None]
+TaskHandler = Callable[[int, dict], Awaitable[None]]
+
+
+class Broker(ABC):
+    def __init__(self):
+        self.on_frame: FrameHandler | None = None
+        self.on_task: TaskHandler | None = None
+        self.tasks: set[asyncio.Task] = set()
+        self.presence: dict[int, int] = {}
+
+    async def start(self, on_frame: FrameHandler, on_task: TaskHandler):
+        self.on_frame = on_frame
+        self.on_task = on_task
+
+    async def stop(self):
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    @abstractmethod
+    async def publish(self, room_id: int, data: str):
+        ...
+
+    @abstractmethod
+    async def submit(self, room_id: int, task: dict):
+        ...
+
+    async def join_room(self, room_id: int):
+        self.presence[room_id] = self.presence.get(room_id, 0) + 1
+
+    async def leave_room(self, room_id: int) -> bool:
+        self._release(room_id)
+        return await self.room_active(room_id)
+
+    async def room_active(self, room_id: int) -> bool:
+        return self.presence.get(room_id, 0) > 0
+
+    def _release(self, room_id: int):
+        remaining = self.presence.get(room_id, 0) - 1
+        if remaining > 0:
+            self.presence[room_id] = remaining
+        else:
+            self.presence.pop(room_id, None)
+
+    def _deliver_frame(self, room_id: int, data: str):
+        if self.on_frame:
+            self.on_frame(room_id, data)
+
+    def _run_task(self, room_id: int, task: dict):
+        if self.on_task:
+            handle = asyncio.create_task(self.on_task(room_id, task))
+            self.tasks.add(handle)
+            handle.add_done_callback(self._task_done)
+
+    def _task_done(self, handle: asyncio.Task):
+        self.tasks.discard(handle)
+        if not handle.cancelled() and (e := handle.exception()) is not None:
+            metrics.inc("errors_total", kind="broker_task")
+            print(f"Broker task error: {e}")
+
+
+class InProcessBroker(Broker):
+    async def publish(self, room_id: int, data: str):
+        self._deliver_frame(room_id, data)
+
+    async def submit(self, room_id: int, task: dict):
+        self._run_task(room_id, task)
+
+
+class SqliteBroker(Broker):
+    """Shares frames and tasks between worker processes through a WAL-mode SQLite file.
+
+    Frames are appended to ``broker_frames`` and tailed by every worker; the
+    publishing worker delivers its own frames immediately and skips them when
+    polling. Tasks are appended to ``broker_tasks`` and claimed with a single
+    ``UPDATE ... RETURNING`` so each one runs on exactly one worker. A room's
+    tasks are only claimed by its owner, ``room_id % live workers`` in
+    ``broker_workers`` order, so every round for a room goes through the same
+    scheduler. Each worker records its connection count per room in
+    ``room_presence`` and heartbeats in ``broker_workers``; workers silent for
+    ``worker_timeout`` are treated as gone, so a crashed worker neither keeps
+    its rooms active nor owns rooms.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        poll_interval: float = 0.02,
+        retention_seconds: float = 60.0,
+        worker_timeout: float = 10.0
+    ):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self.worker_timeout = worker_timeout
+        self.worker_id = uuid.uuid4().hex
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="broker")
+        self.conn: sqlite3.Connection | None = None
+        self.last_frame_id = 0
+        self.poller: asyncio.Task | None = None
+
+    async def _call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def _open(self) -> int:
+        self.conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS broker_frames ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, room_id INTEGER NOT NULL, "
+            "origin TEXT NOT NULL, data TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS broker_tasks ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, room_id INTEGER NOT NULL, "
+            "payload TEXT NOT NULL, claimed_by TEXT, created_at REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_broker_tasks_unclaimed ON broker_tasks (claimed_by, id)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS room_presence ("
+            "worker_id TEXT NOT NULL, room_id INTEGER NOT NULL, connections INTEGER NOT NULL, "
+            "PRIMARY KEY (worker_id, room_id))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS broker_workers ("
+            "worker_id TEXT PRIMARY KEY, heartbeat_at REAL NOT NULL)"
+        )
+        self._heartbeat()
+        row = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM broker_frames").fetchone()
+        return row[0]
+
+    def _insert_frame(self, room_id: int, data: str):
+        self.conn.execute(
+            "INSERT INTO broker_frames (room_id, origin, data, created_at) VALUES (?, ?, ?, ?)",
+            (room_id, self.worker_id, data, time.time())
+        )
+
+    def _insert_task(self, room_id: int, payload: str):
+        self.conn.execute(
+            "INSERT INTO broker_tasks (room_id, payload, created_at) VALUES (?, ?, ?)",
+            (room_id, payload, time.time())
+        )
+
+    def _set_presence(self, room_id: int, connections: int):
+        if connections > 0:
+            self.conn.execute(
+                "INSERT INTO room_presence (worker_id, room_id, connections) VALUES (?, ?, ?) "
+                "ON CONFLICT (worker_id, room_id) DO UPDATE SET connections = excluded.connections",
+                (self.worker_id, room_id, connections)
+            )
+        else:
+            self.conn.execute(
+                "DELETE FROM room_presence WHERE worker_id = ? AND room_id = ?",
+                (self.worker_id, room_id)
+            )
+
+    def _room_connections(self, room_id: int) -> int:
+        row = self.conn.execute(
+            "SELECT COALESCE(SUM(p.connections), 0) FROM room_presence p "
+            "JOIN broker_workers w ON w.worker_id = p.worker_id "
+            "WHERE p.room_id = ? AND w.heartbeat_at >= ?",
+            (room_id, time.time() - self.worker_timeout)
+        ).fetchone()
+        return row[0]
+
+    def _heartbeat(self):
+        self.conn.execute(
+            "INSERT INTO broker_workers (worker_id, heartbeat_at) VALUES (?, ?) "
+            "ON CONFLICT (worker_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at",
+            (self.worker_id, time.time())
+        )
+
+    def _live_workers(self) -> list[str]:
+        workers = [
+            worker_id for (worker_id,) in self.conn.execute(
+                "SELECT worker_id FROM broker_workers WHERE heartbeat_at >= ?",
+                (time.time() - self.worker_timeout,)
+            )
+        ]
+        if self.worker_id not in workers:
+            workers.append(self.worker_id)
+        return sorted(workers)
+
+    def _clear_presence(self):
+        self.conn.execute("DELETE FROM room_presence WHERE worker_id = ?", (self.worker_id,))
+        self.conn.execute("DELETE FROM broker_workers WHERE worker_id = ?", (self.worker_id,))
+
+    def _poll(self, last_frame_id: int) -> tuple[list[tuple[int, int, str, str]], list[tuple[int, str]]]:
+        frames = self.conn.execute(
+            "SELECT id, room_id, origin, data FROM broker_frames WHERE id > ? ORDER BY id",
+            (last_frame_id,)
+        ).fetchall()
+        workers = self._live_workers()
+        claimed = self.conn.execute(
+            "UPDATE broker_tasks SET claimed_by = ? "
+            "WHERE id IN (SELECT id FROM broker_tasks WHERE claimed_by IS NULL AND room_id % ? = ? "
+            "ORDER BY id LIMIT 16) "
+            "RETURNING room_id, payload",
+            (self.worker_id, len(workers), workers.index(self.worker_id))
+        ).fetchall()
+        return frames, claimed
+
+    def _prune(self):
+        cutoff = time.time() - self.retention_seconds
+        self.conn.execute("DELETE FROM broker_frames WHERE created_at < ?", (cutoff,))
+        self.conn.execute(
+            "DELETE FROM broker_tasks WHERE claimed_by IS NOT NULL AND created_at < ?", (cutoff,)
+        )
+        dead = time.time() - self.worker_timeout
+        self.conn.execute(
+            "DELETE FROM room_presence WHERE worker_id IN "
+            "(SELECT worker_id FROM broker_workers WHERE heartbeat_at < ?)", (dead,)
+        )
+        self.conn.execute("DELETE FROM broker_workers WHERE heartbeat_at < ?", (dead,))
+
+    async def start(self, on_frame: FrameHandler, on_task: TaskHandler):
+        await super().start(on_frame, on_task)
+        self.last_frame_id = await self._call(self._open)
+        self.poller = asyncio.create_task(self._poll_loop())
+
+    async def stop(self):
+        if self.poller:
+            self.poller.cancel()
+            try:
+                await self.poller
+            except asyncio.CancelledError:
+                pass
+        await super().stop()
+        if self.conn:
+            await self._call(self._clear_presence)
+            await self._call(self.conn.close)
+        self.executor.shutdown(wait=False)
+
+    async def _poll_loop(self):
+        last_prune = last_heartbeat = time.monotonic()
+        while True:
+            try:
+                if time.monotonic() - last_heartbeat > self.worker_timeout / 3:
+                    await self._call(self._heartbeat)
+                    last_heartbeat = time.monotonic()
+                frames, claimed = await self._call(self._poll, self.last_frame_id)
+                for frame_id, room_id, origin, data in frames:
+                    self.last_frame_id = frame_id
+                    if origin != self.worker_id:
+                        self._deliver_frame(room_id, data)
+                for room_id, payload in claimed:
+                    self._run_task(room_id, json.loads(payload))
+
+                if time.monotonic() - last_prune > self.retention_seconds:
+                    await self._call(self._prune)
+                    last_prune = time.monotonic()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                metrics.inc("errors_total", kind="broker_poll")
+                print(f"Broker poll error: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def join_room(self, room_id: int):
+        await super().join_room(room_id)
+        await self._call(self._set_presence, room_id, self.presence[room_id])
+
+    async def leave_room(self, room_id: int) -> bool:
+        self._release(room_id)
+        await self._call(self._set_presence, room_id, self.presence.get(room_id, 0))
+        return await self.room_active(room_id)
+
+    async def room_active(self, room_id: int) -> bool:
+        if self.presence.get(room_id, 0) > 0:
+            return True
+        return await self._call(self._room_connections, room_id) > 0
+
+    async def publish(self, room_id: int, data: str):
+        self._deliver_frame(room_id, data)
+        await self._call(self._insert_frame, room_id, data)
+
+    async def submit(self, room_id: int, task: dict):
+        await self._call(self._insert_task, room_id, json.dumps(task))
+
+
+def create_broker(
+    backend: Literal["memory", "sqlite"],
+    path: str = "./ambient_chat_broker.db",
+    poll_interval: float = 0.02,
+    retention_seconds: float = 60.0,
+    worker_timeout: float = 10.0
+) -> Broker:
+    if backend == "sqlite":
+        return SqliteBroker(
+            path,
+            poll_interval=poll_interval,
+            retention_seconds=retention_seconds,
+            worker_timeout=worker_timeout
+        )
+    return InProcessBroker()
@@ -0,0 +1,242 @@
+import asyncio
+import math
+import random
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from typing import Literal, TypeVar
+import httpx
+from pydantic_ai.exceptions import ModelHTTPError
+from pydantic_ai.messages import ModelMessage, ModelResponse, TextPart, UserPromptPart
+from pydantic_ai.models import Model
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+from backend.services.metrics import metrics
+
+
+T = TypeVar("T")
+
+LatencyDistribution = Literal["fixed", "uniform", "lognormal"]
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, ModelHTTPError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    if isinstance(error, httpx.TransportError):
+        return True
+    try:
+        import openai
+    except ImportError:
+        return False
+    return isinstance(error, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError))
+
+
+class RateLimiter:
+    def __init__(self, max_concurrency: int = 16, requests_per_second: float = 0.0):
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.requests_per_second = requests_per_second
+        self.tokens = max(requests_per_second, 1.0)
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+        self.waiting = 0
+
+    async def _take_token(self):
+        if self.requests_per_second <= 0:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                capacity = max(self.requests_per_second, 1.0)
+                self.tokens = min(capacity, self.tokens + (now - self.updated_at) * self.requests_per_second)
+                self.updated_at = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self.tokens) / self.requests_per_second)
+
+    @asynccontextmanager
+    async def acquire(self):
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            await self._take_token()
+            yield
+        finally:
+            self.slots.release()
+
+
+class FakeModelFactory:
+    """Builds offline stand-in models that echo the prompt back.
+
+    Latency before the first token follows the configured distribution and the
+    reply is streamed at ``tokens_per_second`` words per second.
+    """
+
+    def __init__(
+        self,
+        distribution: LatencyDistribution = "lognormal",
+        mean: float = 0.5,
+        jitter: float = 0.25,
+        tokens_per_second: float = 40.0,
+        seed: int | None = None
+    ):
+        self.distribution = distribution
+        self.mean = mean
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.random = random.Random(seed)
+
+    def sample_latency(self) -> float:
+        if self.distribution == "fixed" or self.mean <= 0:
+            return max(self.mean, 0.0)
+        if self.distribution == "uniform":
+            return max(self.random.uniform(self.mean - self.jitter, self.mean + self.jitter), 0.0)
+        sigma = math.sqrt(math.log(1 + (self.jitter / self.mean) ** 2))
+        return self.random.lognormvariate(math.log(self.mean) - sigma ** 2 / 2, sigma)
+
+    def reply_for(self, messages: list[ModelMessage]) -> str:
+        prompt = ""
+        for message in reversed(messages):
+            parts = [part for part in getattr(message, "parts", ()) if isinstance(part, UserPromptPart)]
+            if parts and isinstance(parts[-1].content, str):
+                prompt = parts[-1].content
+                break
+        lines = [line for line in prompt.splitlines() if line.strip()]
+        quoted = lines[-2] if len(lines) >= 2 else (lines[0] if lines else "")
+        words = quoted.split()[:24]
+        return "Echo: " + " ".join(words) if words else "Echo."
+
+    def build(self, name: str = "fake") -> Model:
+        async def respond(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+            await asyncio.sleep(self.sample_latency())
+            return ModelResponse(parts=[TextPart(self.reply_for(messages))])
+
+        async def stream(messages: list[ModelMessage], info: AgentInfo) -> AsyncIterator[str]:
+            await asyncio.sleep(self.sample_latency())
+            words = self.reply_for(messages).split(" ")
+            for i, word in enumerate(words):
+                if i and self.tokens_per_second > 0:
+                    await asyncio.sleep(1.0 / self.tokens_per_second)
+                yield word if i == 0 else " " + word
+
+        return FunctionModel(respond, stream_function=stream, model_name=name)
+
+
+class LLMProvider:
+    """Shares one HTTP client, a limiter per model and retry policy across all agents."""
+
+    def __init__(
+        self,
+        api_key: str = "",
+        max_concurrency: int = 16,
+        requests_per_second: float = 0.0,
+        max_retries: int = 3,
+        retry_base_delay: float = 0.5,
+        retry_max_delay: float = 8.0,
+        timeout: float = 60.0,
+        max_connections: int = 100,
+        fake_models: FakeModelFactory | None = None
+    ):
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.fake_models = fake_models or FakeModelFactory()
+        self.http_client: httpx.AsyncClient | None = None
+        self.models: dict[str, Model | str] = {}
+        self.limiters: dict[str, RateLimiter] = {}
+        self.retries = 0
+
+    def _client(self) -> httpx.AsyncClient:
+        if self.http_client is None:
+            self.http_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+        return self.http_client
+
+    def model(self, name: str) -> Model | str:
+        if name in self.models:
+            return self.models[name]
+
+        provider, _, model_name = name.partition(":")
+        if provider == "fake":
+            model: Model | str = self.fake_models.build(name)
+        elif provider == "openai":
+            from openai import AsyncOpenAI
+            from pydantic_ai.models.openai import OpenAIChatModel
+            from pydantic_ai.providers.openai import OpenAIProvider
+
+            client = AsyncOpenAI(api_key=self.api_key or None, http_client=self._client(), max_retries=0)
+            model = OpenAIChatModel(model_name, provider=OpenAIProvider(openai_client=client))
+        else:
+            model = name
+        self.models[name] = model
+        return model
+
+    def waiting(self) -> int:
+        return sum(limiter.waiting for limiter in self.limiters.values())
+
+    def limiter(self, name: str) -> RateLimiter:
+        if name not in self.limiters:
+            self.limiters[name] = RateLimiter(self.max_concurrency, self.requests_per_second)
+        return self.limiters[name]
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+
+    async def call(self, name: str, fn: Callable[[], Awaitable[T]]) -> T:
+        attempt = 0
+        while True:
+            try:
+                async with self.limiter(name).acquire():
+                    with metrics.span("llm_request", model=name):
+                        return await fn()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    metrics.inc("llm_errors_total", model=name, error=type(e).__name__)
+                    raise
+            self.retries += 1
+            metrics.inc("llm_retries_total", model=name)
+            await asyncio.sleep(self.backoff(attempt))
+            attempt += 1
+
+    async def stream(self, name: str, fn: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        # Only retried until the first chunk is out; after that the client has seen a partial reply.
+        attempt = 0
+        while True:
+            started = False
+            try:
+                async with self.limiter(name).acquire():
+                    with metrics.span("llm_request", model=name):
+                        requested_at = time.perf_counter()
+                        async for chunk in fn():
+                            if not started:
+                                metrics.observe("llm_first_chunk_seconds", time.perf_counter() - requested_at, model=name)
+                            started = True
+                            yield chunk
+                return
+            except Exception as e:
+                if started or attempt >= self.max_retries or not is_retryable(e):
+                    metrics.inc("llm_errors_total", model=name, error=type(e).__name__)
+                    raise
+            self.retries += 1
+            metrics.inc("llm_retries_total", model=name)
+            await asyncio.sleep(self.backoff(attempt))
+            attempt += 1
+
+    async def close(self):
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
@@ -0,0 +1,154 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Literal
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from backend.models.database import Message
+from backend.services.metrics import metrics
+
+
+Durability = Literal["sync", "batched"]
+
+
+class MessageWriter:
+    """Persists messages either immediately or in batches behind the hot path.
+
+    In ``batched`` mode ids come from an in-process counter seeded from
+    ``MAX(messages.id)``, so this mode needs to be the only writer of the
+    messages table. A batch the database rejects outright (e.g. a row whose
+    room is gone) is retried row by row and only the rejected rows are
+    dropped; any other failure keeps the whole batch queued for the next flush.
+    """
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker[AsyncSession],
+        durability: Durability = "batched",
+        flush_interval: float = 0.05,
+        batch_size: int = 200
+    ):
+        self.session_maker = session_maker
+        self.durability = durability
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.pending: list[dict] = []
+        self.next_id = 1
+        self.flush_lock = asyncio.Lock()
+        self.wakeup = asyncio.Event()
+        self.flusher: asyncio.Task | None = None
+        self.flushed_rows = 0
+        self.flushes = 0
+
+    async def start(self):
+        if self.durability != "batched":
+            return
+        async with self.session_maker() as session:
+            result = await session.execute(select(func.max(Message.id)))
+            self.next_id = (result.scalar() or 0) + 1
+        self.flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self.flusher:
+            self.flusher.cancel()
+            try:
+                await self.flusher
+            except asyncio.CancelledError:
+                pass
+            self.flusher = None
+        await self.flush()
+
+    async def write(
+        self,
+        room_id: int,
+        sender_type: str,
+        sender_id: str,
+        content: str
+    ) -> Message:
+        if self.durability == "sync":
+            message = Message(
+                room_id=room_id,
+                sender_type=sender_type,
+                sender_id=sender_id,
+                content=content,
+                created_at=datetime.utcnow()
+            )
+            async with self.session_maker() as session:
+                session.add(message)
+                await session.commit()
+            metrics.inc("messages_written_total")
+            return message
+
+        row = {
+            "id": self.next_id,
+            "room_id": room_id,
+            "sender_type": sender_type,
+            "sender_id": sender_id,
+            "content": content,
+            "created_at": datetime.utcnow()
+        }
+        self.next_id += 1
+        self.pending.append(row)
+        if len(self.pending) >= self.batch_size:
+            self.wakeup.set()
+        return Message(**row)
+
+    def discard_room(self, room_id: int):
+        self.pending = [row for row in self.pending if row["room_id"] != room_id]
+
+    async def flush(self):
+        async with self.flush_lock:
+            if not self.pending:
+                return
+            rows, self.pending = self.pending, []
+            started = time.perf_counter()
+            try:
+                await self._insert(rows)
+            except (IntegrityError, DataError):
+                rows = await self._insert_each(rows)
+            except Exception:
+                self.pending = rows + self.pending
+                raise
+            self._written(rows)
+            metrics.observe("message_flush_seconds", time.perf_counter() - started)
+
+    async def _insert(self, rows: list[dict]):
+        async with self.session_maker() as session:
+            for start in range(0, len(rows), self.batch_size):
+                await session.execute(insert(Message).values(rows[start:start + self.batch_size]))
+            await session.commit()
+
+    async def _insert_each(self, rows: list[dict]) -> list[dict]:
+        written = []
+        for index, row in enumerate(rows):
+            try:
+                await self._insert([row])
+            except (IntegrityError, DataError) as e:
+                metrics.inc("messages_dropped_total")
+                print(f"Dropped message {row['id']} for room {row['room_id']}: {e.orig}")
+                continue
+            except Exception:
+                self._written(written)
+                self.pending = rows[index:] + self.pending
+                raise
+            written.append(row)
+        return written
+
+    def _written(self, rows: list[dict]):
+        self.flushed_rows += len(rows)
+        self.flushes += 1
+        metrics.inc("messages_written_total", len(rows))
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                metrics.inc("errors_total", kind="message_flush")
+                print(f"Message flush error: {e}")
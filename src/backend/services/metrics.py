@@ -0,0 +1,203 @@
+import asyncio
+import json
+import logging
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Literal
+
+
+MetricKind = Literal["counter", "gauge", "histogram"]
+LabelKey = tuple[tuple[str, str], ...]
+Sample = float | dict[LabelKey, float]
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+trace_id: ContextVar[str | None] = ContextVar("trace_id", default=None)
+
+
+def label_key(labels: dict[str, object]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(key: LabelKey, extra: tuple[str, str] | None = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs) + "}"
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        i = bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """In-process counters, histograms and callback gauges rendered as Prometheus text.
+
+    Recording is a dict lookup plus a bisect, so spans stay on in production.
+    When a trace log is configured every span is also written as one JSON line
+    tagged with the current ``trace_id``.
+    """
+
+    def __init__(self, namespace: str = "ambient_chat", buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = buckets
+        self.enabled = True
+        self.descriptions: dict[str, tuple[MetricKind, str]] = {}
+        self.counters: dict[str, dict[LabelKey, float]] = {}
+        self.histograms: dict[str, dict[LabelKey, Histogram]] = {}
+        self.callbacks: dict[str, Callable[[], Sample]] = {}
+        self.trace_logger: logging.Logger | None = None
+
+    def configure(self, enabled: bool = True, trace_log_path: str | None = None):
+        self.enabled = enabled
+        if trace_log_path:
+            logger = logging.getLogger(f"{self.namespace}.trace")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(logging.FileHandler(trace_log_path))
+            self.trace_logger = logger
+
+    def describe(self, name: str, kind: MetricKind, help_text: str):
+        self.descriptions[name] = (kind, help_text)
+
+    def inc(self, name: str, value: float = 1.0, **labels: object):
+        if not self.enabled:
+            return
+        series = self.counters.setdefault(name, {})
+        key = label_key(labels)
+        series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: object):
+        if not self.enabled:
+            return
+        series = self.histograms.setdefault(name, {})
+        key = label_key(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def collect(self, name: str, kind: MetricKind, fn: Callable[[], Sample], help_text: str = ""):
+        self.callbacks[name] = fn
+        self.describe(name, kind, help_text)
+
+    @contextmanager
+    def span(self, name: str, **labels: object) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe(f"{name}_seconds", elapsed, **labels)
+            if self.trace_logger:
+                self.trace_logger.info(json.dumps({
+                    "trace_id": trace_id.get(),
+                    "span": name,
+                    "ms": round(elapsed * 1000, 3),
+                    "error": failed,
+                    **{key: str(value) for key, value in labels.items()}
+                }))
+
+    def timed(self, name: str, **labels: object):
+        def decorate(fn):
+            @wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with self.span(name, **labels):
+                    return await fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def _header(self, lines: list[str], name: str, default_kind: MetricKind) -> str:
+        kind, help_text = self.descriptions.get(name, (default_kind, ""))
+        full_name = f"{self.namespace}_{name}"
+        if help_text:
+            lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} {kind}")
+        return full_name
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for name, fn in self.callbacks.items():
+            full_name = self._header(lines, name, "gauge")
+            sample = fn()
+            if isinstance(sample, dict):
+                for key, value in sample.items():
+                    lines.append(f"{full_name}{format_labels(key)} {value}")
+            else:
+                lines.append(f"{full_name} {sample}")
+
+        for name, series in self.counters.items():
+            full_name = self._header(lines, name, "counter")
+            for key, value in series.items():
+                lines.append(f"{full_name}{format_labels(key)} {value}")
+
+        for name, series in self.histograms.items():
+            full_name = self._header(lines, name, "histogram")
+            for key, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{full_name}_bucket{format_labels(key, ('le', str(bound)))} {cumulative}")
+                lines.append(f"{full_name}_bucket{format_labels(key, ('le', '+Inf'))} {histogram.count}")
+                lines.append(f"{full_name}_sum{format_labels(key)} {histogram.sum}")
+                lines.append(f"{full_name}_count{format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+class LoopLagMonitor:
+    def __init__(self, metrics: Metrics, interval: float = 0.25):
+        self.metrics = metrics
+        self.interval = interval
+        self.last_lag = 0.0
+        self.task: asyncio.Task | None = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(loop.time() - started - self.interval, 0.0)
+            self.metrics.observe("event_loop_lag_seconds", self.last_lag)
+
+
+metrics = Metrics()
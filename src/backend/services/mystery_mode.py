@@ -1,17 +1,112 @@
+import asyncio
 import re
+from collections import Counter
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
 from random import choice, choices
 from pydantic_ai import Agent
-from backend.personas.definitions import get_persona_ids
-from backend.config import settings
-import os
+from backend.personas.registry import PersonaRegistry, PersonaSnapshot, registry as default_registry
+from backend.services.cache import TTLCache
+from backend.services.llm import LLMProvider
+from backend.services.metrics import metrics
 
 
-class MysteryModeEngine:
-    def __init__(self, model: str = "openai:gpt-4o-mini"):
+TONES = ("polite", "rude", "curious", "emotional", "analytical", "creative", "sarcastic", "neutral")
+
+TONE_LEXICON: dict[str, dict[str, float]] = {
+    "polite": {
+        "please": 2.0, "thank": 2.0, "thanks": 2.0, "appreciate": 2.0, "kindly": 2.0,
+        "grateful": 2.0, "sorry": 1.0, "excuse": 1.0, "hi": 1.0, "hello": 1.0, "hey": 0.5,
+        "welcome": 1.0, "cheers": 1.0,
+    },
+    "rude": {
+        "stupid": 2.0, "idiot": 2.5, "dumb": 2.0, "shut": 1.5, "hate": 1.5, "useless": 2.0,
+        "moron": 2.5, "wtf": 2.0, "damn": 1.0, "sucks": 1.5, "crap": 1.5, "pathetic": 2.0,
+    },
+    "curious": {
+        "why": 1.5, "how": 1.5, "what": 1.0, "when": 0.5, "where": 0.5, "who": 0.5,
+        "wonder": 2.0, "curious": 2.0, "explain": 1.5, "tell": 0.5, "learn": 1.0,
+    },
+    "emotional": {
+        "feel": 2.0, "feeling": 2.0, "sad": 2.0, "happy": 1.5, "love": 1.5, "lonely": 2.5,
+        "scared": 2.0, "afraid": 2.0, "anxious": 2.5, "cry": 2.0, "miss": 1.5, "hurt": 2.0,
+        "heart": 1.5, "upset": 2.0, "excited": 1.5, "worried": 2.0,
+    },
+    "analytical": {
+        "data": 2.0, "evidence": 2.0, "analysis": 2.0, "analyze": 2.0, "statistics": 2.0,
+        "percent": 1.5, "compare": 1.5, "logic": 1.5, "logical": 1.5, "proof": 1.5,
+        "measure": 1.5, "metric": 1.5, "efficient": 1.0, "optimize": 1.5, "calculate": 2.0,
+    },
+    "creative": {
+        "imagine": 2.0, "story": 1.5, "poem": 2.0, "paint": 2.0, "art": 1.5, "design": 1.5,
+        "dream": 1.5, "create": 1.5, "music": 1.5, "song": 1.5, "write": 1.0, "idea": 1.0,
+        "fashion": 1.5, "style": 1.0, "outfit": 1.5,
+    },
+    "sarcastic": {
+        "lol": 1.5, "lmao": 1.5, "obviously": 1.5, "totally": 1.0, "sure": 0.5, "genius": 1.5,
+        "wow": 1.0, "shocking": 1.5, "yeah": 0.5, "whatever": 1.5, "clearly": 1.0,
+    },
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z']+")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+SARCASM_PATTERN = re.compile(r"\b(yeah right|oh great|oh sure|as if|big surprise)\b")
+
+
+@dataclass(frozen=True)
+class ToneResult:
+    tone: str
+    confidence: float
+
+
+class ToneClassifier(ABC):
+    async def classify(self, message: str) -> ToneResult:
+        return (await self.classify_batch([message]))[0]
+
+    @abstractmethod
+    async def classify_batch(self, messages: list[str]) -> list[ToneResult]:
+        ...
+
+
+class LexiconToneClassifier(ToneClassifier):
+    def __init__(self, lexicon: dict[str, dict[str, float]] = TONE_LEXICON):
+        self.lexicon: dict[str, list[tuple[str, float]]] = {}
+        for tone, words in lexicon.items():
+            for word, weight in words.items():
+                self.lexicon.setdefault(word, []).append((tone, weight))
+
+    def score(self, message: str) -> ToneResult:
+        text = message.lower()
+        tokens = TOKEN_PATTERN.findall(text)
+        scores = dict.fromkeys(TONES, 0.0)
+        for token in tokens:
+            for tone, weight in self.lexicon.get(token.strip("'"), ()):
+                scores[tone] += weight
+
+        if "?" in text:
+            scores["curious"] += 1.0
+        if text.count("!") >= 2 or (len(text) > 8 and message.isupper()):
+            scores["emotional"] += 1.0
+            scores["rude"] += 0.5
+        if SARCASM_PATTERN.search(text):
+            scores["sarcastic"] += 2.5
+
+        total = sum(scores.values())
+        if total == 0:
+            return ToneResult("neutral", 0.6 if len(tokens) <= 3 else 0.0)
+        tone = max(scores, key=scores.get)
+        return ToneResult(tone, scores[tone] / (total + 1.0))
+
+    async def classify_batch(self, messages: list[str]) -> list[ToneResult]:
+        return [self.score(message) for message in messages]
+
+
+class LlmToneClassifier(ToneClassifier):
+    def __init__(self, llm: LLMProvider, model: str):
+        self.llm = llm
         self.model = model
-        os.environ["OPENAI_API_KEY"] = settings.openai_api_key
-        self.tone_analyzer = Agent(
-            self.model,
+        self.agent = Agent(
+            llm.model(model),
             instructions="""Analyze the tone of the user's message. Respond with ONLY ONE of these words:
 - polite: respectful, kind, uses please/thank you
 - rude: disrespectful, aggressive, impolite
@@ -25,25 +120,129 @@ class MysteryModeEngine:
 Respond with just the single word, nothing else."""
         )
 
-    async def analyze_tone(self, message: str) -> str:
-        result = await self.tone_analyzer.run(message)
+    async def _classify_one(self, message: str) -> ToneResult:
+        result = await self.llm.call(self.model, lambda: self.agent.run(message))
         tone = result.output.strip().lower()
-        return tone
+        if tone in TONES:
+            return ToneResult(tone, 1.0)
+        return ToneResult("neutral", 0.0)
+
+    async def classify_batch(self, messages: list[str]) -> list[ToneResult]:
+        return list(await asyncio.gather(*(self._classify_one(message) for message in messages)))
+
+
+class FallbackToneClassifier(ToneClassifier):
+    def __init__(self, primary: ToneClassifier, fallback: ToneClassifier, threshold: float = 0.5):
+        self.primary = primary
+        self.fallback = fallback
+        self.threshold = threshold
+        self.fallback_calls = 0
+
+    async def classify_batch(self, messages: list[str]) -> list[ToneResult]:
+        results = await self.primary.classify_batch(messages)
+        uncertain = [i for i, result in enumerate(results) if result.confidence < self.threshold]
+        if uncertain:
+            self.fallback_calls += len(uncertain)
+            try:
+                retried = await self.fallback.classify_batch([messages[i] for i in uncertain])
+            except Exception as e:
+                # The fallback is best effort; keep the primary's guesses.
+                metrics.inc("errors_total", kind="tone_fallback")
+                print(f"Tone fallback error: {e}")
+                return results
+            for i, result in zip(uncertain, retried):
+                results[i] = result
+        return results
+
+
+class ToneRouter:
+    def __init__(self, tone_personas: dict[str, list[str]], persona_ids: list[str]):
+        known = set(persona_ids)
+        routes: dict[str, tuple[str, ...]] = {}
+        for tone, personas in tone_personas.items():
+            if tone not in TONES:
+                raise ValueError(f"Unknown tone in routing table: {tone}")
+            unknown = [persona_id for persona_id in personas if persona_id not in known]
+            if unknown:
+                raise ValueError(f"Unknown personas for tone {tone}: {', '.join(unknown)}")
+            routes[tone] = tuple(personas)
+        self.all_personas = tuple(persona_ids)
+        self.routes = routes
+
+    def personas_for(self, tone: str) -> tuple[str, ...]:
+        return self.routes.get(tone) or self.all_personas
+
+
+def build_tone_router(snapshot: PersonaSnapshot) -> ToneRouter:
+    return ToneRouter(snapshot.tone_personas, snapshot.ids)
+
+
+def normalize_message(message: str) -> str:
+    return WHITESPACE_PATTERN.sub(" ", message.strip().lower())
+
+
+class MysteryModeEngine:
+    def __init__(
+        self,
+        llm: LLMProvider,
+        model: str = "openai:gpt-4o-mini",
+        classifier: str = "lexicon",
+        confidence_threshold: float = 0.5,
+        llm_fallback: bool = True,
+        cache_size: int = 1024,
+        cache_ttl: float | None = 600.0,
+        registry: PersonaRegistry = default_registry
+    ):
+        self.model = model
+        self.classifier = classifier
+        self.confidence_threshold = confidence_threshold
+        self.llm_fallback = llm_fallback
+        self.registry = registry
+        registry.derive("tone_router", build_tone_router)
+        self.tone_cache: TTLCache[str] = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.lexicon = LexiconToneClassifier()
+        self.selections: Counter[str] = Counter()
+        if classifier == "llm":
+            self.tone_classifier: ToneClassifier = LlmToneClassifier(llm, self.model)
+        elif llm_fallback:
+            self.tone_classifier = FallbackToneClassifier(
+                self.lexicon, LlmToneClassifier(llm, self.model), confidence_threshold
+            )
+        else:
+            self.tone_classifier = self.lexicon
+
+    @property
+    def router(self) -> ToneRouter:
+        return self.registry.derived("tone_router")
+
+    async def analyze_tone(self, message: str) -> str:
+        return (await self.analyze_tones([message]))[0]
+
+    @metrics.timed("tone_analysis")
+    async def analyze_tones(self, messages: list[str]) -> list[str]:
+        keys = [normalize_message(message) for message in messages]
+        tones = [self.tone_cache.get(key) for key in keys]
+        missing = [i for i, tone in enumerate(tones) if tone is None]
+        if missing:
+            results = await self.tone_classifier.classify_batch([messages[i] for i in missing])
+            for i, result in zip(missing, results):
+                tones[i] = result.tone
+                self.tone_cache.set(keys[i], result.tone)
+        return tones
+
+    def likely_personas(self, message: str, limit: int) -> list[str]:
+        # Only worth guessing when the tone will come from a model call; a cached
+        # or confident local classification is already instant.
+        if normalize_message(message) in self.tone_cache:
+            return []
+        guess = self.lexicon.score(message)
+        if self.classifier != "llm" and (not self.llm_fallback or guess.confidence >= self.confidence_threshold):
+            return []
+        candidates = self.router.personas_for(guess.tone)
+        return sorted(candidates, key=lambda persona_id: -self.selections[persona_id])[:limit]
 
     def select_persona_by_tone(self, tone: str) -> str:
-        tone_to_personas = {
-            "polite": ["wise_grandmother", "angel", "compassionate_listener", "renaissance_artist"],
-            "rude": ["devils_advocate", "sarcastic_tech", "cold_analyst"],
-            "curious": ["wise_grandmother", "devils_advocate", "medieval_barkeeper"],
-            "emotional": ["compassionate_listener", "angel", "wise_grandmother"],
-            "analytical": ["cold_analyst", "devils_advocate", "sarcastic_tech"],
-            "creative": ["renaissance_artist", "medieval_barkeeper", "angel"],
-            "sarcastic": ["sarcastic_tech", "devils_advocate", "medieval_barkeeper"],
-            "neutral": get_persona_ids()
-        }
-
-        available_personas = tone_to_personas.get(tone, get_persona_ids())
-        return choice(available_personas)
+        return choice(self.router.personas_for(tone))
 
     async def select_responding_personas(
         self,
@@ -51,21 +250,7 @@ Respond with just the single word, nothing else."""
         num_responses: int = 2
     ) -> list[str]:
         tone = await self.analyze_tone(message)
-
-        available_personas = []
-        if tone in ["polite", "rude", "curious", "emotional", "analytical", "creative", "sarcastic"]:
-            tone_to_personas = {
-                "polite": ["wise_grandmother", "angel", "compassionate_listener", "renaissance_artist"],
-                "rude": ["devils_advocate", "sarcastic_tech", "cold_analyst"],
-                "curious": ["wise_grandmother", "devils_advocate", "medieval_barkeeper"],
-                "emotional": ["compassionate_listener", "angel", "wise_grandmother"],
-                "analytical": ["cold_analyst", "devils_advocate", "sarcastic_tech"],
-                "creative": ["renaissance_artist", "medieval_barkeeper", "angel"],
-                "sarcastic": ["sarcastic_tech", "devils_advocate", "medieval_barkeeper"]
-            }
-            available_personas = tone_to_personas.get(tone, get_persona_ids())
-        else:
-            available_personas = get_persona_ids()
-
+        available_personas = self.router.personas_for(tone)
         selected = choices(available_personas, k=min(num_responses, len(available_personas)))
+        self.selections.update(set(selected))
         return selected
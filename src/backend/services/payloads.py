@@ -0,0 +1,29 @@
+import hashlib
+import json
+from fastapi import Request, Response
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip().removeprefix("W/")
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+
+class CachedPayload:
+    """A JSON body encoded once, with a strong ETag derived from its bytes."""
+
+    __slots__ = ("body", "etag", "headers")
+
+    def __init__(self, data, headers: dict[str, str] | None = None):
+        self.body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+        self.headers = {"ETag": self.etag, "Cache-Control": "no-cache", **(headers or {})}
+
+    def response(self, request: Request) -> Response:
+        if etag_matches(request.headers.get("if-none-match"), self.etag):
+            return Response(status_code=304, headers=self.headers)
+        return Response(self.body, media_type="application/json", headers=self.headers)
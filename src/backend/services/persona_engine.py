@@ -1,65 +1,372 @@
 import asyncio
+import hashlib
+import re
+import time
+from datetime import datetime, timedelta
+from collections.abc import AsyncIterator, Callable
 from random import uniform
 from pydantic_ai import Agent
-from backend.personas.definitions import get_persona, get_all_personas, PersonaTrait
-from backend.config import settings
-import os
+from pydantic_ai.usage import RunUsage
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from backend.models.database import CachedResponse
+from backend.personas.definitions import PersonaTrait
+from backend.personas.registry import PersonaRegistry, registry as default_registry
+from backend.services.cache import TTLCache
+from backend.services.llm import LLMProvider
+from backend.services.metrics import metrics
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+class TokenCounter:
+    def __init__(self, encoding: str = "o200k_base"):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.get_encoding(encoding)
+            except Exception:
+                self.encoding = None
+
+    def count(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        return (len(text) + 3) // 4
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text)
+            if len(tokens) <= max_tokens:
+                return text
+            return self.encoding.decode(tokens[:max_tokens]) + "…"
+        if len(text) <= max_tokens * 4:
+            return text
+        return text[:max_tokens * 4] + "…"
+
+
+class PromptBuilder:
+    """Renders conversation history into persona prompts.
+
+    Older turns are frozen into a per-room prefix that stays byte-identical
+    until ``block_size`` newer messages have arrived, so provider-side prompt
+    caching can reuse it across calls. Rendered lines are memoized by message
+    id and shared by every persona answering the same message.
+    """
+
+    def __init__(
+        self,
+        max_history_tokens: int = 1500,
+        max_message_tokens: int = 200,
+        recent_messages: int = 8,
+        block_size: int = 16,
+        counter: TokenCounter | None = None
+    ):
+        self.max_history_tokens = max_history_tokens
+        self.max_message_tokens = max_message_tokens
+        self.recent_messages = recent_messages
+        self.block_size = block_size
+        self.counter = counter or TokenCounter()
+        self.lines: TTLCache[tuple[str, int]] = TTLCache(maxsize=4096, ttl=None)
+        self.prefixes: TTLCache[tuple[int, str, int]] = TTLCache(maxsize=1024, ttl=3600.0)
+
+    def render_message(self, msg: dict) -> tuple[str, int]:
+        message_id = msg.get("id")
+        if message_id is not None:
+            cached = self.lines.get(message_id)
+            if cached is not None:
+                return cached
+
+        content = self.counter.truncate(msg.get("content", ""), self.max_message_tokens)
+        if msg.get("sender_type", "") == "persona":
+            line = f"{msg.get('sender_id', 'Unknown')}: {content}"
+        else:
+            line = f"user: {content}"
+        rendered = (line, self.counter.count(line) + 1)
+        if message_id is not None:
+            self.lines.set(message_id, rendered)
+        return rendered
+
+    def _render_block(self, entries: list[dict], budget: int) -> tuple[str, int]:
+        lines: list[str] = []
+        used = 0
+        for msg in reversed(entries):
+            line, tokens = self.render_message(msg)
+            if used + tokens > budget:
+                break
+            lines.append(line)
+            used += tokens
+        lines.reverse()
+        return "\n".join(lines), used
+
+    def _split(self, room_id: int | None, history: list[dict]) -> tuple[str, int, list[dict]]:
+        recent_start = max(len(history) - self.recent_messages, 0)
+        prefix_budget = self.max_history_tokens // 2
+        if room_id is None or any(msg.get("id") is None for msg in history):
+            return *self._render_block(history[:recent_start], prefix_budget), history[recent_start:]
+
+        ids = [msg["id"] for msg in history]
+        cached = self.prefixes.get(room_id)
+        if cached is not None:
+            end_id, text, tokens = cached
+            if end_id in ids:
+                split = ids.index(end_id) + 1
+                if len(history) - split <= self.recent_messages + self.block_size:
+                    return text, tokens, history[split:]
+
+        text, tokens = self._render_block(history[:recent_start], prefix_budget)
+        if recent_start:
+            self.prefixes.set(room_id, (ids[recent_start - 1], text, tokens))
+        return text, tokens, history[recent_start:]
+
+    def build(self, user_message: str, history: list[dict] | None = None, room_id: int | None = None) -> str:
+        if not history:
+            return f"{user_message}\n\nRespond briefly in 1-2 sentences."
+
+        prefix, prefix_tokens, recent = self._split(room_id, history)
+
+        budget = self.max_history_tokens - (prefix_tokens if prefix else 0)
+        recent_text, _ = self._render_block(recent, max(budget, 0))
+        if not recent_text and recent:
+            recent_text = self.render_message(recent[-1])[0]
+
+        sections = []
+        if prefix:
+            sections.append(f"Earlier conversation:\n{prefix}")
+        sections.append(f"Recent conversation:\n{recent_text}")
+        sections.append("Respond naturally to this conversation. Keep it brief (1-2 sentences).")
+        return "\n\n".join(sections)
+
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+class ResponseCache:
+    """Reuses persona replies for identical recent context.
+
+    Keys hash the persona and the last ``context_messages`` turns with case,
+    punctuation and user ids stripped, so "Hi!" and "hi" in fresh rooms share
+    an entry. With a session maker, entries are also written to the
+    ``response_cache`` table and reloaded on startup.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 2048,
+        ttl: float = 3600.0,
+        context_messages: int = 2,
+        session_maker: async_sessionmaker[AsyncSession] | None = None
+    ):
+        self.ttl = ttl
+        self.context_messages = context_messages
+        self.session_maker = session_maker
+        self.entries: TTLCache[str] = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.writes: set[asyncio.Task] = set()
+
+    def key(self, persona_id: str, user_message: str, history: list[dict] | None) -> str:
+        recent = list(history or [])[-self.context_messages:]
+        if not recent or recent[-1].get("content") != user_message:
+            recent.append({"sender_type": "user", "content": user_message})
+        parts = [persona_id]
+        for msg in recent:
+            speaker = msg.get("sender_id", "") if msg.get("sender_type") == "persona" else "user"
+            parts.append(f"{speaker}:{' '.join(WORD_PATTERN.findall(msg.get('content', '').lower()))}")
+        return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        content = self.entries.get(key)
+        metrics.inc("response_cache_total", result="hit" if content is not None else "miss")
+        return content
+
+    def set(self, key: str, persona_id: str, content: str):
+        if not content:
+            return
+        self.entries.set(key, content)
+        if self.session_maker is not None:
+            task = asyncio.create_task(self._persist(key, persona_id, content))
+            self.writes.add(task)
+            task.add_done_callback(self.writes.discard)
+
+    async def _persist(self, key: str, persona_id: str, content: str):
+        try:
+            async with self.session_maker() as session:
+                row = {"key": key, "persona_id": persona_id, "content": content, "created_at": datetime.utcnow()}
+                await session.execute(
+                    insert(CachedResponse).values(row).on_conflict_do_update(
+                        index_elements=[CachedResponse.key],
+                        set_={"content": content, "created_at": row["created_at"]}
+                    )
+                )
+                await session.commit()
+        except Exception as e:
+            metrics.inc("errors_total", kind="response_cache")
+            print(f"Response cache write error: {e}")
+
+    async def load(self):
+        if self.session_maker is None:
+            return
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=self.ttl)
+        async with self.session_maker() as session:
+            await session.execute(delete(CachedResponse).where(CachedResponse.created_at < cutoff))
+            await session.commit()
+            result = await session.execute(
+                select(CachedResponse.key, CachedResponse.content, CachedResponse.created_at)
+                .order_by(CachedResponse.created_at.desc())
+                .limit(self.entries.maxsize)
+            )
+            rows = result.all()
+        for key, content, created_at in reversed(rows):
+            self.entries.set(key, content, ttl=self.ttl - (now - created_at).total_seconds())
+
+    async def close(self):
+        await asyncio.gather(*self.writes, return_exceptions=True)
 
 
 class PersonaEngine:
-    def __init__(self, model: str = "openai:gpt-4o-mini"):
+    def __init__(
+        self,
+        llm: LLMProvider,
+        model: str = "openai:gpt-4o-mini",
+        persona_models: dict[str, str] | None = None,
+        stream_debounce: float | None = 0.05,
+        prompt_builder: PromptBuilder | None = None,
+        followup_delay: float = 0.5,
+        response_cache: ResponseCache | None = None,
+        registry: PersonaRegistry = default_registry,
+        on_usage: Callable[[int, int], None] | None = None
+    ):
+        self.llm = llm
         self.model = model
-        self.agents: dict[str, Agent] = {}
-        os.environ["OPENAI_API_KEY"] = settings.openai_api_key
-        self._initialize_agents()
-
-    def _initialize_agents(self):
-        personas = get_all_personas()
-        for persona_id, persona_trait in personas.items():
-            agent = Agent(
-                self.model,
-                instructions=persona_trait.system_prompt
-            )
-            self.agents[persona_id] = agent
+        self.persona_models = persona_models or {}
+        self.stream_debounce = stream_debounce
+        self.prompt_builder = prompt_builder or PromptBuilder()
+        self.followup_delay = followup_delay
+        self.response_cache = response_cache
+        self.registry = registry
+        self.agents: dict[str, tuple[PersonaTrait, Agent]] = {}
+        self.on_usage = on_usage
+
+    def model_for(self, persona_id: str) -> str:
+        return self.persona_models.get(persona_id, self.model)
+
+    def _record_usage(self, persona_id: str, usage: RunUsage, room_id: int | None = None):
+        model = self.model_for(persona_id)
+        metrics.inc("llm_tokens_total", usage.input_tokens, model=model, direction="input")
+        metrics.inc("llm_tokens_total", usage.output_tokens, model=model, direction="output")
+        metrics.inc("llm_cached_tokens_total", usage.cache_read_tokens, model=model)
+        if self.on_usage is not None and room_id is not None:
+            self.on_usage(room_id, usage.input_tokens + usage.output_tokens)
+
+    def prompt_tokens(self, user_message: str, history: list[dict] | None = None, room_id: int | None = None) -> int:
+        return self.prompt_builder.counter.count(self.prompt_builder.build(user_message, history, room_id))
+
+    def _agent(self, persona_id: str) -> Agent:
+        persona_trait = self.registry.all().get(persona_id)
+        if persona_trait is None:
+            raise ValueError(f"Unknown persona: {persona_id}")
+        # Agents are built on first use and rebuilt when a reload changes the persona.
+        cached = self.agents.get(persona_id)
+        if cached is not None and cached[0] is persona_trait:
+            return cached[1]
+        agent = Agent(
+            self.llm.model(self.model_for(persona_id)),
+            instructions=persona_trait.system_prompt
+        )
+        self.agents[persona_id] = (persona_trait, agent)
+        return agent
+
+    def release_at(self, persona_id: str, depth: int = 0) -> float:
+        # The typing delay runs concurrently with generation: a reply is held
+        # until this deadline, or released immediately if the model was slower.
+        persona_trait = self.registry.get(persona_id)
+        delay = uniform(persona_trait.response_delay_min, persona_trait.response_delay_max)
+        if depth > 0:
+            delay += self.followup_delay
+        return time.monotonic() + delay
+
+    async def _hold_until(self, persona_id: str, deadline: float):
+        remaining = deadline - time.monotonic()
+        metrics.observe("persona_hold_seconds", max(remaining, 0.0), persona=persona_id)
+        if remaining > 0:
+            await asyncio.sleep(remaining)
 
     async def generate_response(
         self,
         persona_id: str,
         user_message: str,
-        conversation_history: list[dict[str, str]] = None
+        conversation_history: list[dict[str, str]] = None,
+        room_id: int | None = None,
+        release_at: float | None = None
     ) -> str:
-        if persona_id not in self.agents:
-            raise ValueError(f"Unknown persona: {persona_id}")
+        agent = self._agent(persona_id)
+        deadline = release_at if release_at is not None else self.release_at(persona_id)
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = self.response_cache.key(persona_id, user_message, conversation_history)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                await self._hold_until(persona_id, deadline)
+                return cached
 
-        agent = self.agents[persona_id]
-        persona_trait = get_persona(persona_id)
+        prompt = self.prompt_builder.build(user_message, conversation_history, room_id)
+        result = await self.llm.call(self.model_for(persona_id), lambda: agent.run(prompt))
+        self._record_usage(persona_id, result.usage(), room_id)
+        if cache_key is not None:
+            self.response_cache.set(cache_key, persona_id, result.output)
+        await self._hold_until(persona_id, deadline)
+        return result.output
 
-        delay = uniform(persona_trait.response_delay_min, persona_trait.response_delay_max)
-        await asyncio.sleep(delay)
-
-        if conversation_history and len(conversation_history) > 0:
-            recent_messages = conversation_history[-8:]
-            context = "Recent conversation:\n"
-            for msg in recent_messages:
-                sender_type = msg.get("sender_type", "")
-                sender_id = msg.get("sender_id", "Unknown")
-                content = msg.get("content", "")
-
-                if sender_type == "persona":
-                    context += f"\n\n{sender_id}: {content}\n"
-                else:
-                    context += f"\n\nuser: {content}\n"
-
-            context += f"\nRespond naturally to this conversation. Keep it brief (1-2 sentences)."
-            prompt = context
-        else:
-            prompt = f"{user_message}\n\nRespond briefly in 1-2 sentences."
+    async def stream_response(
+        self,
+        persona_id: str,
+        user_message: str,
+        conversation_history: list[dict[str, str]] = None,
+        room_id: int | None = None,
+        release_at: float | None = None
+    ) -> AsyncIterator[str]:
+        agent = self._agent(persona_id)
+        deadline = release_at if release_at is not None else self.release_at(persona_id)
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = self.response_cache.key(persona_id, user_message, conversation_history)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                await self._hold_until(persona_id, deadline)
+                yield cached
+                return
 
-        result = await agent.run(prompt)
-        return result.output
+        prompt = self.prompt_builder.build(user_message, conversation_history, room_id)
+
+        async def deltas() -> AsyncIterator[str]:
+            async with agent.run_stream(prompt) as result:
+                async for delta in result.stream_text(delta=True, debounce_by=self.stream_debounce):
+                    if delta:
+                        yield delta
+            self._record_usage(persona_id, result.usage(), room_id)
+
+        held: list[str] = []
+        streamed: list[str] = []
+        async for delta in self.llm.stream(self.model_for(persona_id), deltas):
+            streamed.append(delta)
+            if time.monotonic() < deadline:
+                held.append(delta)
+                continue
+            if held:
+                delta = "".join(held) + delta
+                held.clear()
+            yield delta
+        if cache_key is not None:
+            self.response_cache.set(cache_key, persona_id, "".join(streamed))
+        if held:
+            await self._hold_until(persona_id, deadline)
+            yield "".join(held)
 
     def get_persona_info(self, persona_id: str) -> PersonaTrait:
-        return get_persona(persona_id)
+        return self.registry.get(persona_id)
 
     def get_all_persona_info(self) -> dict[str, PersonaTrait]:
-        return get_all_personas()
+        return self.registry.all()
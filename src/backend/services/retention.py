@@ -0,0 +1,137 @@
+import asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from backend.models.database import Message
+from backend.services.archive import MessageArchive
+from backend.services.metrics import metrics
+
+
+class RetentionManager:
+    """Moves old messages out of the hot table into the archive.
+
+    A room keeps at most ``max_messages`` rows and none older than
+    ``max_age_days``; everything before that cutoff is written to archive
+    segments in id order and then bulk-deleted. Rows at or below a room's
+    highest archived id are always archived already, so a pass interrupted
+    between writing a segment and deleting its rows is finished by the next
+    one.
+    """
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker[AsyncSession],
+        archive: MessageArchive,
+        max_messages: int = 0,
+        max_age_days: float = 0.0,
+        interval: float = 300.0,
+        batch_size: int = 2000
+    ):
+        self.session_maker = session_maker
+        self.archive = archive
+        self.max_messages = max_messages
+        self.max_age_days = max_age_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.task: asyncio.Task | None = None
+        self.archived_rows = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_messages > 0 or self.max_age_days > 0
+
+    def start(self):
+        if self.enabled:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.compact()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                metrics.inc("errors_total", kind="retention")
+                print(f"Retention error: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _cutoffs(self, session: AsyncSession) -> dict[int, int]:
+        newest_id = (await session.execute(select(func.max(Message.id)))).scalar()
+        if not newest_id:
+            return {}
+
+        cutoffs: dict[int, int] = {}
+        if self.max_messages > 0:
+            crowded = await session.execute(
+                select(Message.room_id).group_by(Message.room_id).having(func.count() > self.max_messages)
+            )
+            for room_id in crowded.scalars().all():
+                cutoffs[room_id] = (await session.execute(
+                    select(Message.id).where(Message.room_id == room_id)
+                    .order_by(Message.id.desc()).offset(self.max_messages).limit(1)
+                )).scalar()
+
+        if self.max_age_days > 0:
+            threshold = datetime.utcnow() - timedelta(days=self.max_age_days)
+            aged = await session.execute(
+                select(Message.room_id, func.max(Message.id))
+                .where(Message.created_at < threshold)
+                .group_by(Message.room_id)
+            )
+            for room_id, cutoff in aged.all():
+                cutoffs[room_id] = max(cutoffs.get(room_id, 0), cutoff)
+
+        # New ids are derived from MAX(id), both by SQLite and by the batched
+        # writer, so the newest row has to stay in the table.
+        return {
+            room_id: min(cutoff, newest_id - 1)
+            for room_id, cutoff in cutoffs.items()
+            if min(cutoff, newest_id - 1) > 0
+        }
+
+    async def _compact_room(self, session: AsyncSession, room_id: int, cutoff_id: int) -> int:
+        archived_id = self.archive.max_id(room_id)
+        if archived_id is not None:
+            await session.execute(
+                delete(Message).where(Message.room_id == room_id, Message.id <= archived_id)
+            )
+            await session.commit()
+
+        moved = 0
+        while True:
+            result = await session.execute(
+                select(Message.id, Message.sender_type, Message.sender_id, Message.content, Message.created_at)
+                .where(Message.room_id == room_id, Message.id <= cutoff_id)
+                .order_by(Message.id.asc())
+                .limit(self.batch_size)
+            )
+            rows = [dict(row) for row in result.mappings().all()]
+            if not rows:
+                return moved
+            await self.archive.write_segment(room_id, rows)
+            await session.execute(
+                delete(Message).where(Message.room_id == room_id, Message.id <= rows[-1]["id"])
+            )
+            await session.commit()
+            moved += len(rows)
+
+    async def compact(self) -> int:
+        moved = 0
+        with metrics.span("retention_compaction"):
+            async with self.session_maker() as session:
+                cutoffs = await self._cutoffs(session)
+                await session.commit()
+                for room_id, cutoff_id in cutoffs.items():
+                    moved += await self._compact_room(session, room_id, cutoff_id)
+        self.archived_rows += moved
+        metrics.inc("messages_archived_total", moved)
+        return moved
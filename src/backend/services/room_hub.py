@@ -0,0 +1,221 @@
+import asyncio
+import json
+import time
+from typing import Literal
+from fastapi import WebSocket, WebSocketDisconnect
+from backend.services.metrics import metrics
+from backend.services.wire import JSON_CODEC, JsonCodec
+
+
+SlowClientPolicy = Literal["drop", "disconnect"]
+
+PING_FRAME = json.dumps({"type": "ping"})
+IDLE_CLOSE_CODE = 4001
+MAX_BATCH_FRAMES = 64
+
+
+class Connection:
+    def __init__(
+        self,
+        hub: "RoomHub",
+        room_id: int,
+        websocket: WebSocket,
+        max_queue_size: int,
+        codec: JsonCodec = JSON_CODEC
+    ):
+        self.hub = hub
+        self.room_id = room_id
+        self.websocket = websocket
+        self.codec = codec
+        self.ping_frame = codec.encode(PING_FRAME)
+        self.queue: asyncio.Queue[str | bytes] = asyncio.Queue(maxsize=max_queue_size)
+        self.dropped = 0
+        self.closed = False
+        self.writer: asyncio.Task | None = None
+        self.last_message = time.monotonic()
+        self.pinged = False
+
+    def start(self):
+        self.writer = asyncio.create_task(self._write_loop())
+
+    async def _write_loop(self):
+        try:
+            while True:
+                data = await self.queue.get()
+                if self.codec.batches and not self.queue.empty():
+                    frames = [data]
+                    while not self.queue.empty() and len(frames) < MAX_BATCH_FRAMES:
+                        frames.append(self.queue.get_nowait())
+                    data = self.codec.batch(frames)
+                if isinstance(data, str):
+                    await self.websocket.send_text(data)
+                else:
+                    await self.websocket.send_bytes(data)
+                metrics.inc("ws_sent_bytes_total", len(data), protocol=self.codec.subprotocol or "json")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.hub.discard(self)
+
+    async def receive(self) -> dict | None:
+        """Returns the next client message, or None once the client has been evicted.
+
+        A client that stays silent for ``ping_interval`` is pinged and must answer
+        within ``pong_timeout``; a client that only answers pings for
+        ``idle_timeout`` is closed as idle.
+        """
+        hub = self.hub
+        while True:
+            timeout = hub.pong_timeout if self.pinged else hub.ping_interval
+            try:
+                received = await asyncio.wait_for(self.websocket.receive(), timeout or None)
+            except TimeoutError:
+                if self.pinged:
+                    await self.evict("heartbeat", 1001, "Heartbeat timeout")
+                    return None
+                self.pinged = True
+                self.enqueue(self.ping_frame, hub.slow_client_policy)
+                received = None
+
+            data = None
+            if received is not None:
+                if received["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(received.get("code", 1000), received.get("reason"))
+                data = received["text"] if received.get("text") is not None else received.get("bytes")
+
+            if data is not None:
+                self.pinged = False
+                if len(data) > hub.max_message_size:
+                    await self.evict("too_big", 1009, "Message too big")
+                    return None
+                message = self.codec.decode(data)
+                if message.get("type") not in ("pong", "ping"):
+                    self.last_message = time.monotonic()
+                    return message
+
+            if hub.idle_timeout and time.monotonic() - self.last_message > hub.idle_timeout:
+                await self.evict("idle", IDLE_CLOSE_CODE, "Idle timeout")
+                return None
+
+    async def evict(self, reason: str, code: int, message: str):
+        metrics.inc("connections_evicted_total", reason=reason)
+        self.hub.discard(self)
+        await self._close(code=code, reason=message)
+
+    def send(self, payload: dict) -> bool:
+        return self.enqueue(self.codec.encode(json.dumps(payload)), self.hub.slow_client_policy)
+
+    def enqueue(self, data: str | bytes, policy: SlowClientPolicy) -> bool:
+        try:
+            self.queue.put_nowait(data)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        if policy == "disconnect":
+            self.hub.disconnected_slow_clients += 1
+            self.hub.discard(self)
+            asyncio.create_task(self._close(code=1013, reason="Client too slow"))
+            return False
+
+        self.queue.get_nowait()
+        self.queue.put_nowait(data)
+        self.dropped += 1
+        return False
+
+    async def _close(self, code: int = 1000, reason: str | None = None):
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    def stop(self):
+        self.closed = True
+        if self.writer and not self.writer.done() and self.writer is not asyncio.current_task():
+            self.writer.cancel()
+
+
+class RoomHub:
+    def __init__(
+        self,
+        max_queue_size: int = 256,
+        slow_client_policy: SlowClientPolicy = "drop",
+        max_connections: int = 0,
+        max_room_connections: int = 0,
+        ping_interval: float = 20.0,
+        pong_timeout: float = 20.0,
+        idle_timeout: float = 0.0,
+        max_message_size: int = 16384
+    ):
+        self.max_queue_size = max_queue_size
+        self.slow_client_policy = slow_client_policy
+        self.max_connections = max_connections
+        self.max_room_connections = max_room_connections
+        self.ping_interval = ping_interval
+        self.pong_timeout = pong_timeout
+        self.idle_timeout = idle_timeout
+        self.max_message_size = max_message_size
+        self.rooms: dict[int, set[Connection]] = {}
+        self.dropped_sends = 0
+        self.disconnected_slow_clients = 0
+
+    def admission_error(self, room_id: int) -> str | None:
+        if self.max_connections and self.connection_count() >= self.max_connections:
+            return "Server full"
+        if self.max_room_connections and self.connection_count(room_id) >= self.max_room_connections:
+            return "Room full"
+        return None
+
+    def join(self, room_id: int, websocket: WebSocket, codec: JsonCodec = JSON_CODEC) -> Connection:
+        connection = Connection(self, room_id, websocket, self.max_queue_size, codec)
+        hello = codec.hello()
+        if hello is not None:
+            connection.queue.put_nowait(hello)
+        self.rooms.setdefault(room_id, set()).add(connection)
+        connection.start()
+        return connection
+
+    def discard(self, connection: Connection):
+        connections = self.rooms.get(connection.room_id)
+        if connections is not None and connection in connections:
+            connections.discard(connection)
+            if not connections:
+                del self.rooms[connection.room_id]
+        connection.stop()
+
+    async def leave(self, connection: Connection):
+        self.discard(connection)
+        if connection.writer:
+            try:
+                await connection.writer
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def broadcast_raw(self, room_id: int, data: str) -> int:
+        delivered = 0
+        encoded: dict[JsonCodec, str | bytes] = {}
+        for connection in list(self.rooms.get(room_id, ())):
+            frame = encoded.get(connection.codec)
+            if frame is None:
+                frame = encoded[connection.codec] = connection.codec.encode(data)
+            if connection.enqueue(frame, self.slow_client_policy):
+                delivered += 1
+            elif self.slow_client_policy == "drop":
+                self.dropped_sends += 1
+        return delivered
+
+    def connection_count(self, room_id: int | None = None) -> int:
+        if room_id is not None:
+            return len(self.rooms.get(room_id, ()))
+        return sum(len(connections) for connections in self.rooms.values())
+
+    def queue_depth(self, room_id: int) -> int:
+        return sum(connection.queue.qsize() for connection in self.rooms.get(room_id, ()))
+
+    def queue_depths(self) -> dict[int, int]:
+        return {room_id: self.queue_depth(room_id) for room_id in self.rooms}
+
+    async def close(self):
+        for connections in list(self.rooms.values()):
+            for connection in list(connections):
+                await self.leave(connection)
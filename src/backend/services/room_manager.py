@@ -1,41 +1,104 @@
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+from collections import deque
+from collections.abc import AsyncIterator
+from sqlalchemy import Row, Select, delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from backend.models.database import Room, Message
+from backend.services.archive import ArchivedMessage, MessageArchive
+from backend.services.message_writer import MessageWriter
+from backend.services.metrics import metrics
 from datetime import datetime
 
 
 class RoomManager:
-    async def create_room(self, session: AsyncSession, name: str, mystery_mode: bool = False) -> Room:
-        room = Room(name=name, mystery_mode=mystery_mode)
-        session.add(room)
-        await session.commit()
-        await session.refresh(room)
+    """Repository for rooms and messages.
+
+    Concurrency contract: callers never hold or pass a session. Every method
+    opens its own short-lived session, writes on ``session_maker`` and reads
+    on ``read_session_maker``, and releases it before returning, so any number
+    of tasks (sockets, persona replies, follow-ups that outlive their socket)
+    may call in concurrently. Results are Core rows, plain dicts or detached
+    objects that stay valid after the session is gone. Reads that hit the
+    database flush pending batched writes first, so a caller reads its own
+    writes. The in-memory history is only mutated between awaits, and its
+    first load per room is serialized by a per-room lock.
+    """
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker[AsyncSession],
+        read_session_maker: async_sessionmaker[AsyncSession] | None = None,
+        history_size: int = 50,
+        shared_history: bool = False,
+        writer: MessageWriter | None = None,
+        archive: MessageArchive | None = None
+    ):
+        self.session_maker = session_maker
+        self.read_session_maker = read_session_maker or session_maker
+        self.history_size = history_size
+        self.shared_history = shared_history
+        self.writer = writer
+        self.archive = archive
+        self.history: dict[int, deque[dict]] = {}
+        self.pending_history: dict[int, list[dict]] = {}
+        self.history_locks: dict[int, asyncio.Lock] = {}
+        self.directory_version = 0
+
+    @metrics.timed("room_manager", op="create_room")
+    async def create_room(self, name: str, mystery_mode: bool = False) -> Room:
+        async with self.session_maker() as session:
+            room = Room(name=name, mystery_mode=mystery_mode)
+            session.add(room)
+            await session.commit()
+            await session.refresh(room)
+        self.directory_version += 1
         return room
 
-    async def get_room(self, session: AsyncSession, room_id: int) -> Room | None:
-        result = await session.execute(select(Room).where(Room.id == room_id))
-        return result.scalar_one_or_none()
+    def _room_query(self) -> Select:
+        return select(Room.id, Room.name, Room.mystery_mode, Room.created_at)
+
+    @metrics.timed("room_manager", op="get_room")
+    async def get_room(self, room_id: int) -> Row | None:
+        async with self.read_session_maker() as session:
+            result = await session.execute(self._room_query().where(Room.id == room_id))
+            return result.first()
 
-    async def get_all_rooms(self, session: AsyncSession) -> list[Room]:
-        result = await session.execute(select(Room).order_by(Room.created_at.desc()))
-        return list(result.scalars().all())
+    @metrics.timed("room_manager", op="get_room_page")
+    async def get_room_page(self, limit: int = 100, before_id: int | None = None) -> list[Row]:
+        query = self._room_query()
+        if before_id is not None:
+            query = query.where(Room.id < before_id)
+        async with self.read_session_maker() as session:
+            result = await session.execute(query.order_by(Room.id.desc()).limit(limit))
+            return list(result.all())
 
-    async def delete_room(self, session: AsyncSession, room_id: int) -> bool:
-        room = await self.get_room(session, room_id)
-        if room:
-            await session.delete(room)
+    @metrics.timed("room_manager", op="delete_room")
+    async def delete_room(self, room_id: int) -> bool:
+        if self.writer:
+            self.writer.discard_room(room_id)
+        async with self.session_maker() as session:
+            await session.execute(delete(Message).where(Message.room_id == room_id))
+            result = await session.execute(delete(Room).where(Room.id == room_id))
             await session.commit()
-            return True
-        return False
+        self.directory_version += 1
+        self.forget_history(room_id)
+        if self.archive:
+            await self.archive.delete_room(room_id)
+        return result.rowcount > 0
 
+    @metrics.timed("room_manager", op="save_message")
     async def save_message(
         self,
-        session: AsyncSession,
         room_id: int,
         sender_type: str,
         sender_id: str,
         content: str
     ) -> Message:
+        if self.writer:
+            message = await self.writer.write(room_id, sender_type, sender_id, content)
+            self._remember(message)
+            return message
+
         message = Message(
             room_id=room_id,
             sender_type=sender_type,
@@ -43,37 +106,182 @@ class RoomManager:
             content=content,
             created_at=datetime.utcnow()
         )
-        session.add(message)
-        await session.commit()
-        await session.refresh(message)
+        async with self.session_maker() as session:
+            session.add(message)
+            await session.commit()
+        self._remember(message)
         return message
 
-    async def get_room_messages(
+    @metrics.timed("room_manager", op="flush_pending")
+    async def flush_pending(self):
+        if self.writer:
+            await self.writer.flush()
+
+    def _history_entry(self, message: Message) -> dict:
+        return {
+            "id": message.id,
+            "sender_type": message.sender_type,
+            "sender_id": message.sender_id,
+            "content": message.content
+        }
+
+    def _remember(self, message: Message):
+        if self.shared_history:
+            return
+        entry = self._history_entry(message)
+        if message.room_id in self.history:
+            self.history[message.room_id].append(entry)
+        elif message.room_id in self.pending_history:
+            self.pending_history[message.room_id].append(entry)
+
+    def _message_page_query(
         self,
-        session: AsyncSession,
         room_id: int,
+        before_id: int | None = None,
+        after_id: int | None = None,
         limit: int = 100
-    ) -> list[Message]:
-        result = await session.execute(
-            select(Message)
-            .where(Message.room_id == room_id)
-            .order_by(Message.created_at.asc())
-            .limit(limit)
-        )
-        return list(result.scalars().all())
+    ) -> Select:
+        query = select(
+            Message.id,
+            Message.sender_type,
+            Message.sender_id,
+            Message.content,
+            Message.created_at
+        ).where(Message.room_id == room_id)
+        if before_id is not None:
+            query = query.where(Message.id < before_id)
+        if after_id is not None:
+            query = query.where(Message.id > after_id)
+
+        if after_id is not None and before_id is None:
+            return query.order_by(Message.id.asc()).limit(limit)
+
+        page = query.order_by(Message.id.desc()).limit(limit).subquery()
+        return select(page).order_by(page.c.id.asc())
+
+    async def _read_archive(
+        self,
+        room_id: int,
+        before_id: int | None,
+        after_id: int | None,
+        limit: int,
+        newest: bool
+    ) -> list[ArchivedMessage]:
+        if not self.archive:
+            return []
+        return await self.archive.read(room_id, before_id, after_id, limit, newest)
+
+    # Archived ids are always below the ids still in the table, so a page is
+    # the archived part followed by the hot part.
+    @metrics.timed("room_manager", op="get_message_page")
+    async def get_message_page(
+        self,
+        room_id: int,
+        before_id: int | None = None,
+        after_id: int | None = None,
+        limit: int = 100
+    ) -> list[Row | ArchivedMessage]:
+        await self.flush_pending()
+        if after_id is not None and before_id is None:
+            archived = await self._read_archive(room_id, None, after_id, limit, newest=False)
+            if len(archived) >= limit:
+                return archived
+            async with self.read_session_maker() as session:
+                result = await session.execute(
+                    self._message_page_query(room_id, None, after_id, limit - len(archived))
+                )
+                return [*archived, *result.all()]
+
+        async with self.read_session_maker() as session:
+            result = await session.execute(
+                self._message_page_query(room_id, before_id, after_id, limit)
+            )
+            hot = list(result.all())
+        archived = await self._read_archive(room_id, before_id, after_id, limit - len(hot), newest=True)
+        return [*archived, *hot]
+
+    async def stream_message_page(
+        self,
+        room_id: int,
+        before_id: int | None = None,
+        after_id: int | None = None,
+        limit: int = 100
+    ) -> AsyncIterator[Row | ArchivedMessage]:
+        await self.flush_pending()
+        async with self.read_session_maker() as session:
+            if after_id is not None and before_id is None:
+                archived = await self._read_archive(room_id, None, after_id, limit, newest=False)
+                limit -= len(archived)
+            elif self.archive and self.archive.has_room(room_id):
+                page = self._message_page_query(room_id, before_id, after_id, limit).subquery()
+                hot_count = (await session.execute(select(func.count()).select_from(page))).scalar()
+                archived = await self._read_archive(room_id, before_id, after_id, limit - hot_count, newest=True)
+            else:
+                archived = []
 
-    async def get_conversation_history(
+            for row in archived:
+                yield row
+            if limit <= 0:
+                return
+            result = await session.stream(
+                self._message_page_query(room_id, before_id, after_id, limit)
+            )
+            async for row in result:
+                yield row
+
+    @metrics.timed("room_manager", op="get_recent_messages")
+    async def get_recent_messages(
         self,
-        session: AsyncSession,
         room_id: int,
-        limit: int = 10
-    ) -> list[dict[str, str]]:
-        messages = await self.get_room_messages(session, room_id, limit)
-        return [
-            {
-                "sender_type": msg.sender_type,
-                "sender_id": msg.sender_id,
-                "content": msg.content
-            }
-            for msg in messages
-        ]
+        limit: int = 50,
+        after_id: int | None = None
+    ) -> list[dict]:
+        query = select(
+            Message.id, Message.sender_type, Message.sender_id, Message.content
+        ).where(Message.room_id == room_id)
+        if after_id is not None:
+            query = query.where(Message.id > after_id)
+        async with self.read_session_maker() as session:
+            result = await session.execute(
+                query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit)
+            )
+            return [dict(row) for row in reversed(result.mappings().all())]
+
+    async def _load_history(self, room_id: int):
+        self.pending_history[room_id] = []
+        try:
+            await self.flush_pending()
+            messages = await self.get_recent_messages(room_id, self.history_size)
+            buffer = deque(messages, maxlen=self.history_size)
+            loaded = {entry["id"] for entry in buffer}
+            buffer.extend(
+                entry for entry in self.pending_history[room_id] if entry["id"] not in loaded
+            )
+            self.history[room_id] = buffer
+        finally:
+            del self.pending_history[room_id]
+
+    async def _catch_up(self, room_id: int):
+        buffer = self.history[room_id]
+        last_id = buffer[-1]["id"] if buffer else 0
+        await self.flush_pending()
+        newer = await self.get_recent_messages(room_id, self.history_size, after_id=last_id)
+        # Concurrent catch-ups fetch the same rows; only append what is still new.
+        last_id = buffer[-1]["id"] if buffer else 0
+        buffer.extend(entry for entry in newer if entry["id"] > last_id)
+
+    def forget_history(self, room_id: int):
+        self.history.pop(room_id, None)
+        self.history_locks.pop(room_id, None)
+
+    @metrics.timed("room_manager", op="get_conversation_history")
+    async def get_conversation_history(self, room_id: int, limit: int = 10) -> list[dict[str, str]]:
+        if room_id not in self.history:
+            lock = self.history_locks.setdefault(room_id, asyncio.Lock())
+            async with lock:
+                if room_id not in self.history:
+                    await self._load_history(room_id)
+        elif self.shared_history:
+            await self._catch_up(room_id)
+
+        return list(self.history[room_id])[-limit:]
@@ -0,0 +1,198 @@
+import asyncio
+import heapq
+import itertools
+from collections.abc import Awaitable, Callable, Sequence
+from dataclasses import dataclass, field
+from random import sample
+from backend.services.admission import TokenBucket
+from backend.services.metrics import metrics
+
+
+GenerateFn = Callable[[int, str, str, int], Awaitable[bool]]
+RoomActiveFn = Callable[[int], Awaitable[bool]]
+
+
+@dataclass(order=True)
+class ScheduledReply:
+    priority: int
+    seq: int
+    persona_id: str = field(compare=False)
+    depth: int = field(compare=False)
+    epoch: int = field(compare=False)
+
+
+@dataclass
+class RoomSchedule:
+    epoch: int = 0
+    user_message: str = ""
+    budget: int = 0
+    tokens: int = 0
+    queue: list[ScheduledReply] = field(default_factory=list)
+    queued: set[str] = field(default_factory=set)
+    in_flight: dict[str, tuple[asyncio.Task, ScheduledReply]] = field(default_factory=dict)
+
+
+class ConversationScheduler:
+    """Runs persona replies for each room from a priority queue.
+
+    Direct replies to a user message are queued at depth 0 and always run
+    before persona-to-persona follow-ups. Every user message opens a new
+    round with a fixed reply budget; a newer round drops whatever the previous
+    one still had queued and cancels everything it still has in flight.
+
+    LLM tokens reported through ``charge`` count against the room's round
+    and a process-wide per-minute bucket. Once either is spent, follow-ups
+    are no longer queued or started; direct replies to the human still run.
+    """
+
+    def __init__(
+        self,
+        generate: GenerateFn,
+        persona_ids: Callable[[], Sequence[str]],
+        is_room_active: RoomActiveFn,
+        round_budget: int = 8,
+        round_token_budget: int = 0,
+        process_tokens_per_minute: float = 0.0,
+        max_depth: int = 3,
+        per_room_concurrency: int = 4,
+        global_concurrency: int = 16
+    ):
+        self.generate = generate
+        self.persona_ids = persona_ids
+        self.is_room_active = is_room_active
+        self.round_budget = round_budget
+        self.round_token_budget = round_token_budget
+        self.process_tokens = TokenBucket(
+            process_tokens_per_minute / 60, process_tokens_per_minute
+        ) if process_tokens_per_minute > 0 else None
+        self.max_depth = max_depth
+        self.per_room_concurrency = per_room_concurrency
+        self.global_slots = asyncio.Semaphore(global_concurrency)
+        self.rooms: dict[int, RoomSchedule] = {}
+        self.seq = itertools.count()
+
+    def start_round(self, room_id: int, user_message: str, persona_ids: list[str]) -> list[str]:
+        schedule = self.rooms.setdefault(room_id, RoomSchedule())
+        schedule.epoch += 1
+        schedule.user_message = user_message
+        schedule.budget = self.round_budget
+        schedule.tokens = 0
+        schedule.queue.clear()
+        schedule.queued.clear()
+        # Dropped from in_flight right away so the new round's replies are not
+        # deduped against personas that are only still unwinding.
+        for task, _ in schedule.in_flight.values():
+            task.cancel()
+        schedule.in_flight.clear()
+
+        scheduled = [
+            persona_id for persona_id in persona_ids
+            if self._enqueue(room_id, schedule, persona_id, depth=0)
+        ]
+        self._pump(room_id)
+        return scheduled
+
+    def charge(self, room_id: int, tokens: int):
+        schedule = self.rooms.get(room_id)
+        if schedule is not None:
+            schedule.tokens += tokens
+        if self.process_tokens is not None:
+            self.process_tokens.take(tokens)
+
+    def _tokens_left(self, schedule: RoomSchedule) -> bool:
+        if 0 < self.round_token_budget <= schedule.tokens:
+            metrics.inc("persona_followups_skipped_total", reason="round_tokens")
+            return False
+        if self.process_tokens is not None and self.process_tokens.retry_after() > 0:
+            metrics.inc("persona_followups_skipped_total", reason="process_tokens")
+            return False
+        return True
+
+    def cancel_room(self, room_id: int):
+        schedule = self.rooms.pop(room_id, None)
+        if schedule is None:
+            return
+        schedule.queue.clear()
+        schedule.queued.clear()
+        for task, _ in list(schedule.in_flight.values()):
+            task.cancel()
+
+    def queue_depth(self, room_id: int | None = None) -> int:
+        if room_id is not None:
+            schedule = self.rooms.get(room_id)
+            return len(schedule.queue) if schedule else 0
+        return sum(len(schedule.queue) for schedule in self.rooms.values())
+
+    def in_flight(self, room_id: int | None = None) -> int:
+        if room_id is not None:
+            schedule = self.rooms.get(room_id)
+            return len(schedule.in_flight) if schedule else 0
+        return sum(len(schedule.in_flight) for schedule in self.rooms.values())
+
+    async def close(self):
+        tasks = [task for schedule in self.rooms.values() for task, _ in schedule.in_flight.values()]
+        for room_id in list(self.rooms):
+            self.cancel_room(room_id)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _enqueue(self, room_id: int, schedule: RoomSchedule, persona_id: str, depth: int) -> bool:
+        if schedule.budget <= 0:
+            return False
+        if persona_id in schedule.queued or persona_id in schedule.in_flight:
+            return False
+        schedule.budget -= 1
+        schedule.queued.add(persona_id)
+        heapq.heappush(
+            schedule.queue,
+            ScheduledReply(depth, next(self.seq), persona_id, depth, schedule.epoch)
+        )
+        return True
+
+    def _pump(self, room_id: int):
+        schedule = self.rooms.get(room_id)
+        if schedule is None:
+            return
+        while schedule.queue and len(schedule.in_flight) < self.per_room_concurrency:
+            reply = heapq.heappop(schedule.queue)
+            schedule.queued.discard(reply.persona_id)
+            if reply.persona_id in schedule.in_flight:
+                continue
+            if reply.depth > 0 and not self._tokens_left(schedule):
+                continue
+            task = asyncio.create_task(self._run(room_id, schedule, reply))
+            schedule.in_flight[reply.persona_id] = (task, reply)
+
+    async def _run(self, room_id: int, schedule: RoomSchedule, reply: ScheduledReply):
+        completed = False
+        try:
+            if await self.is_room_active(room_id):
+                async with self.global_slots:
+                    completed = await self.generate(
+                        room_id, reply.persona_id, schedule.user_message, reply.depth
+                    )
+        except asyncio.CancelledError:
+            pass
+        finally:
+            entry = schedule.in_flight.get(reply.persona_id)
+            if entry is not None and entry[1] is reply:
+                del schedule.in_flight[reply.persona_id]
+
+        if completed and reply.epoch == schedule.epoch and self.rooms.get(room_id) is schedule:
+            self._schedule_followups(room_id, schedule, reply)
+        if not schedule.queue and not schedule.in_flight and self.rooms.get(room_id) is schedule:
+            del self.rooms[room_id]
+        else:
+            self._pump(room_id)
+
+    def _schedule_followups(self, room_id: int, schedule: RoomSchedule, reply: ScheduledReply):
+        if reply.depth >= self.max_depth or not self._tokens_left(schedule):
+            return
+        candidates = [
+            persona_id for persona_id in self.persona_ids()
+            if persona_id != reply.persona_id
+            and persona_id not in schedule.queued
+            and persona_id not in schedule.in_flight
+        ]
+        num_followups = 2 if reply.depth == 0 else 1
+        for persona_id in sample(candidates, min(num_followups, len(candidates))):
+            self._enqueue(room_id, schedule, persona_id, depth=reply.depth + 1)
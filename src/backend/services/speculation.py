@@ -0,0 +1,121 @@
+import asyncio
+import time
+from collections.abc import AsyncIterator, Callable
+from backend.services.metrics import metrics
+
+
+StreamFactory = Callable[[], AsyncIterator[str]]
+
+
+class Speculation:
+    def __init__(self, user_message: str, prompt_tokens: int, stream: StreamFactory):
+        self.user_message = user_message
+        self.prompt_tokens = prompt_tokens
+        self.started_at = time.monotonic()
+        self.chunks: list[str] = []
+        self.error: BaseException | None = None
+        self.done = False
+        self.changed = asyncio.Condition()
+        self.task = asyncio.create_task(self._run(stream))
+
+    async def _run(self, stream: StreamFactory):
+        try:
+            async for chunk in stream():
+                self.chunks.append(chunk)
+                async with self.changed:
+                    self.changed.notify_all()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            async with self.changed:
+                self.changed.notify_all()
+
+    async def replay(self) -> AsyncIterator[str]:
+        sent = 0
+        while True:
+            while sent < len(self.chunks):
+                yield self.chunks[sent]
+                sent += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            async with self.changed:
+                if sent == len(self.chunks) and not self.done:
+                    await self.changed.wait()
+
+    async def result(self) -> str:
+        return "".join([chunk async for chunk in self.replay()])
+
+    def cancel(self):
+        self.task.cancel()
+
+
+class Speculator:
+    """Starts persona replies before the responders are known.
+
+    Speculations are keyed by room and persona and only adopted by a reply to
+    the same user message. Once a round is scheduled, ``resolve`` cancels the
+    ones no reply of that round will claim, along with any left over from
+    earlier messages in the room; their prompt and generated tokens are
+    counted as waste.
+    """
+
+    def __init__(self, count_tokens: Callable[[str], int], ttl: float = 30.0):
+        self.count_tokens = count_tokens
+        self.ttl = ttl
+        self.pending: dict[tuple[int, str], Speculation] = {}
+
+    def start(self, room_id: int, persona_id: str, user_message: str, prompt_tokens: int, stream: StreamFactory):
+        self._expire()
+        previous = self.pending.pop((room_id, persona_id), None)
+        if previous is not None:
+            self._discard(previous, "superseded")
+        self.pending[(room_id, persona_id)] = Speculation(user_message, prompt_tokens, stream)
+        metrics.inc("speculations_started_total")
+
+    def claim(self, room_id: int, persona_id: str, user_message: str) -> Speculation | None:
+        speculation = self.pending.get((room_id, persona_id))
+        if speculation is None or speculation.user_message != user_message:
+            return None
+        del self.pending[(room_id, persona_id)]
+        metrics.inc("speculations_total", outcome="hit")
+        return speculation
+
+    def resolve(self, room_id: int, user_message: str, persona_ids: list[str]):
+        scheduled = set(persona_ids)
+        for (pending_room, persona_id), speculation in list(self.pending.items()):
+            if pending_room != room_id:
+                continue
+            if speculation.user_message != user_message:
+                del self.pending[(pending_room, persona_id)]
+                self._discard(speculation, "superseded")
+            elif persona_id not in scheduled:
+                del self.pending[(pending_room, persona_id)]
+                self._discard(speculation, "miss")
+
+    def cancel_room(self, room_id: int):
+        for key in [key for key in self.pending if key[0] == room_id]:
+            self._discard(self.pending.pop(key), "cancelled")
+
+    async def close(self):
+        speculations = list(self.pending.values())
+        self.pending.clear()
+        for speculation in speculations:
+            speculation.cancel()
+        await asyncio.gather(*(speculation.task for speculation in speculations), return_exceptions=True)
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        for key in [key for key, speculation in self.pending.items() if speculation.started_at < cutoff]:
+            self._discard(self.pending.pop(key), "expired")
+
+    def _discard(self, speculation: Speculation, outcome: str):
+        speculation.cancel()
+        wasted = speculation.prompt_tokens + self.count_tokens("".join(speculation.chunks))
+        metrics.inc("speculations_total", outcome=outcome)
+        metrics.inc("speculation_wasted_tokens_total", wasted)
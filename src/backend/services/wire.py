@@ -0,0 +1,147 @@
+import json
+from datetime import datetime, UTC
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+FRAME_TYPES = [
+    "hello",
+    "ping",
+    "user_message",
+    "persona_message",
+    "persona_typing",
+    "persona_message_start",
+    "persona_message_delta",
+    "persona_message_end",
+    "persona_message_cancelled",
+    "error",
+    "throttled",
+]
+FRAME_TYPE_CODES = {name: code for code, name in enumerate(FRAME_TYPES)}
+
+FIELD_KEYS = {
+    "id": "i",
+    "message_id": "m",
+    "persona_id": "p",
+    "user_id": "u",
+    "content": "c",
+    "delta": "d",
+    "created_at": "ts",
+    "message": "e",
+    "reason": "r",
+    "retry_after": "ra",
+}
+FIELD_NAMES = {key: name for name, key in FIELD_KEYS.items()}
+
+# Implied by the frame type or the persona index.
+DROPPED_FIELDS = {"type", "sender_type", "persona_name"}
+
+
+class JsonCodec:
+    """The default protocol: verbose JSON text frames, one per message."""
+
+    subprotocol: str | None = None
+    batches = False
+
+    def encode(self, data: str) -> str | bytes:
+        return data
+
+    def decode(self, data: str | bytes) -> dict:
+        return json.loads(data)
+
+    def hello(self) -> str | bytes | None:
+        return None
+
+
+class CompactCodec(JsonCodec):
+    """JSON frames with short keys, integer frame types and persona indexes.
+
+    Persona ids and names are sent once in the ``hello`` frame. Several frames
+    queued for the same socket are sent as one array.
+    """
+
+    subprotocol = "ambient.compact.v1"
+    batches = True
+
+    def __init__(self, personas: dict[str, str]):
+        self.personas = personas
+        self.persona_index = {persona_id: index for index, persona_id in enumerate(personas)}
+
+    def compact(self, payload: dict) -> dict:
+        frame = {"t": FRAME_TYPE_CODES.get(payload["type"], payload["type"])}
+        for name, value in payload.items():
+            if name in DROPPED_FIELDS or value is None:
+                continue
+            if name == "persona_id":
+                value = self.persona_index.get(value, value)
+            elif name == "created_at":
+                value = int(datetime.fromisoformat(value).replace(tzinfo=UTC).timestamp() * 1000)
+            frame[FIELD_KEYS.get(name, name)] = value
+        return frame
+
+    def dump(self, frame: dict | list) -> str | bytes:
+        return json.dumps(frame, separators=(",", ":"))
+
+    def encode(self, data: str) -> str | bytes:
+        return self.dump(self.compact(json.loads(data)))
+
+    def batch(self, frames: list[str | bytes]) -> str | bytes:
+        return "[" + ",".join(frames) + "]"
+
+    def hello(self) -> str | bytes | None:
+        return self.dump({
+            "t": FRAME_TYPE_CODES["hello"],
+            "types": FRAME_TYPES,
+            "keys": FIELD_KEYS,
+            "personas": [[persona_id, name] for persona_id, name in self.personas.items()],
+        })
+
+
+class MsgpackCodec(CompactCodec):
+    subprotocol = "ambient.msgpack.v1"
+
+    def dump(self, frame: dict | list) -> str | bytes:
+        return msgpack.packb(frame)
+
+    def decode(self, data: str | bytes) -> dict:
+        if isinstance(data, bytes):
+            return msgpack.unpackb(data)
+        return json.loads(data)
+
+    def batch(self, frames: list[str | bytes]) -> str | bytes:
+        packer = msgpack.Packer()
+        return packer.pack_array_header(len(frames)) + b"".join(frames)
+
+
+def expand(frame: dict, personas: list[str]) -> dict:
+    """Turns a compact frame back into the JSON protocol's shape, minus dropped fields."""
+    payload = {"type": FRAME_TYPES[frame["t"]] if isinstance(frame["t"], int) else frame["t"]}
+    for key, value in frame.items():
+        if key == "t":
+            continue
+        name = FIELD_NAMES.get(key, key)
+        if name == "persona_id" and isinstance(value, int):
+            value = personas[value]
+        payload[name] = value
+    return payload
+
+
+JSON_CODEC = JsonCodec()
+
+
+def available_codecs(personas: dict[str, str]) -> list[JsonCodec]:
+    available = [CompactCodec(personas), JSON_CODEC]
+    if msgpack is not None:
+        available.insert(0, MsgpackCodec(personas))
+    return available
+
+
+def negotiate(offered: list[str], available: list[JsonCodec]) -> JsonCodec:
+    by_subprotocol = {codec.subprotocol: codec for codec in available}
+    for subprotocol in offered:
+        if subprotocol in by_subprotocol:
+            return by_subprotocol[subprotocol]
+    return by_subprotocol[None]
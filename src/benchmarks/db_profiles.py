@@ -0,0 +1,100 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from backend.models.database import Base, Message, Room, create_engine_for_profile, _create_indexes
+
+
+async def run_profile(profile: str, rooms: int, inserts: int, batch_size: int, reads: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+        engine = create_engine_for_profile(url, profile)
+        read_engine = create_engine_for_profile(url, profile, read_only=True)
+        session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        read_session_maker = async_sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(_create_indexes)
+        async with session_maker() as session:
+            session.add_all(Room(name=f"room-{i}") for i in range(rooms))
+            await session.commit()
+
+        def row(i: int) -> dict:
+            return {
+                "room_id": random.randint(1, rooms),
+                "sender_type": "user",
+                "sender_id": "bench",
+                "content": f"message {i}",
+                "created_at": datetime.utcnow()
+            }
+
+        started = time.perf_counter()
+        async with session_maker() as session:
+            for i in range(inserts):
+                session.add(Message(**row(i)))
+                await session.commit()
+        single_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        async with session_maker() as session:
+            for start in range(0, inserts, batch_size):
+                await session.execute(
+                    insert(Message).values([row(i) for i in range(start, min(start + batch_size, inserts))])
+                )
+                await session.commit()
+        batched_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        async with read_session_maker() as session:
+            for _ in range(reads):
+                await session.execute(
+                    select(Message.id, Message.sender_id, Message.content)
+                    .where(Message.room_id == random.randint(1, rooms))
+                    .order_by(Message.created_at.desc())
+                    .limit(50)
+                )
+        read_elapsed = time.perf_counter() - started
+
+        await engine.dispose()
+        await read_engine.dispose()
+
+    return {
+        "profile": profile,
+        "single_insert_per_s": round(inserts / single_elapsed, 1),
+        "batched_insert_rows_per_s": round(inserts / batched_elapsed, 1),
+        "latest_page_reads_per_s": round(reads / read_elapsed, 1),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compare SQLite engine profiles")
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--inserts", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--reads", type=int, default=2000)
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = []
+    for profile in ("development", "production"):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = await run_profile(profile, args.rooms, args.inserts, args.batch_size, args.reads)
+        results.append(result)
+
+    report = json.dumps({"benchmark": "db_profiles", "args": vars(args), "results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
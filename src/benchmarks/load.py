@@ -0,0 +1,324 @@
+import argparse
+import asyncio
+import dataclasses
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+import httpx
+from websockets.asyncio.client import connect
+from backend.services import wire
+
+SUBPROTOCOLS = {"json": None, "compact": "ambient.compact.v1", "msgpack": "ambient.msgpack.v1"}
+
+
+def percentiles(samples: list[float]) -> dict:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def rank(p: float) -> float:
+        return round(ordered[min(int(p * len(ordered)), len(ordered) - 1)] * 1000, 2)
+
+    return {
+        "count": len(ordered),
+        "p50_ms": rank(0.50),
+        "p95_ms": rank(0.95),
+        "p99_ms": rank(0.99),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def serve(args: argparse.Namespace):
+    import uvicorn
+    from sqlalchemy import func, select
+    from backend.main import app, message_writer, room_hub
+    from backend.models.database import Message, read_session_maker
+    from backend.personas.registry import registry
+
+    if not args.persona_delays:
+        registry.replace({
+            persona_id: dataclasses.replace(persona, response_delay_min=0.0, response_delay_max=0.0)
+            for persona_id, persona in registry.all().items()
+        })
+
+    lags: list[float] = []
+
+    async def monitor_lag():
+        interval = 0.01
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            lags.append(max(time.perf_counter() - started - interval, 0.0))
+
+    @app.on_event("startup")
+    async def start_monitor():
+        app.state.lag_monitor = asyncio.create_task(monitor_lag())
+
+    @app.get("/_bench/stats")
+    async def stats(reset: bool = False):
+        async with read_session_maker() as session:
+            persisted = (await session.execute(select(func.count(Message.id)))).scalar()
+        result = {
+            "rss_bytes": rss_bytes(),
+            "connections": room_hub.connection_count(),
+            "dropped_sends": room_hub.dropped_sends,
+            "disconnected_slow_clients": room_hub.disconnected_slow_clients,
+            "persisted_messages": persisted,
+            "pending_messages": len(message_writer.pending),
+            "loop_lag": percentiles(lags),
+        }
+        if reset:
+            lags.clear()
+        return result
+
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+@dataclass
+class Round:
+    room_id: int
+    sent_at: float
+    receipts: list[float] = field(default_factory=list)
+
+
+@dataclass
+class LoadStats:
+    echo: list[float] = field(default_factory=list)
+    first_reply: list[float] = field(default_factory=list)
+    reply: list[float] = field(default_factory=list)
+    frames: Counter = field(default_factory=Counter)
+    rounds: dict[str, Round] = field(default_factory=dict)
+    errors: Counter = field(default_factory=Counter)
+    bytes_received: int = 0
+    messages_received: int = 0
+
+
+def decode_frames(raw: str | bytes, personas: list[str]) -> list[dict]:
+    decoded = json.loads(raw) if isinstance(raw, str) else wire.msgpack.unpackb(raw)
+    frames = decoded if isinstance(decoded, list) else [decoded]
+    if frames and "t" not in frames[0]:
+        return frames
+    if frames and frames[0]["t"] == wire.FRAME_TYPE_CODES["hello"]:
+        personas[:] = [persona_id for persona_id, _ in frames[0]["personas"]]
+    return [wire.expand(frame, personas) for frame in frames]
+
+
+async def run_client(
+    base_url: str,
+    room_id: int,
+    client_id: int,
+    messages: int,
+    rate: float,
+    settle: float,
+    stats: LoadStats,
+    connected: asyncio.Barrier,
+    protocol: str = "json"
+):
+    # Replies carry no reference to the user message they answer, so each client
+    # attributes persona frames to the latest round it has seen in its room.
+    url = base_url.replace("http", "ws", 1) + f"/ws/rooms/{room_id}"
+    current: Round | None = None
+    replied = False
+    personas: list[str] = []
+
+    async def receive(ws):
+        nonlocal current, replied
+        async for raw in ws:
+            now = time.perf_counter()
+            stats.messages_received += 1
+            stats.bytes_received += len(raw)
+            for frame in decode_frames(raw, personas):
+                kind = frame.get("type")
+                stats.frames[kind] += 1
+                if kind == "ping":
+                    await ws.send(json.dumps({"type": "pong"}))
+                elif kind == "user_message":
+                    token = frame.get("content", "").rsplit(" ", 1)[-1]
+                    round_ = stats.rounds.get(token)
+                    if round_ is None:
+                        continue
+                    round_.receipts.append(now)
+                    if frame.get("user_id") == f"bench-{client_id}":
+                        stats.echo.append(now - round_.sent_at)
+                    current, replied = round_, False
+                elif kind in ("persona_message_start", "persona_message") and current and not replied:
+                    stats.first_reply.append(now - current.sent_at)
+                    replied = True
+                if kind in ("persona_message_end", "persona_message") and current:
+                    stats.reply.append(now - current.sent_at)
+
+    subprotocol = SUBPROTOCOLS[protocol]
+    try:
+        async with connect(url, max_size=None, subprotocols=[subprotocol] if subprotocol else None) as ws:
+            await connected.wait()
+            receiver = asyncio.create_task(receive(ws))
+            for _ in range(messages):
+                await asyncio.sleep(random.expovariate(rate) if rate > 0 else 0)
+                token = uuid.uuid4().hex
+                stats.rounds[token] = Round(room_id, time.perf_counter())
+                await ws.send(json.dumps({"user_id": f"bench-{client_id}", "message": f"load test {token}"}))
+            await asyncio.sleep(settle)
+            receiver.cancel()
+    except Exception as e:
+        stats.errors[type(e).__name__] += 1
+        if not connected.broken:
+            await connected.abort()
+
+
+async def drive(args: argparse.Namespace, base_url: str) -> dict:
+    async with httpx.AsyncClient(base_url=base_url, timeout=30.0) as http:
+        room_ids = []
+        for i in range(args.rooms):
+            response = await http.post("/rooms", params={"name": f"load-{i}", "mystery_mode": args.mystery})
+            room_ids.append(response.json()["id"])
+
+        baseline = (await http.get("/_bench/stats", params={"reset": True})).json()
+        stats = LoadStats()
+        connected = asyncio.Barrier(args.clients + 1)
+        started = time.perf_counter()
+        clients = [
+            asyncio.create_task(run_client(
+                base_url, room_ids[i % args.rooms], i, args.messages, args.rate, args.settle, stats, connected,
+                args.protocol
+            ))
+            for i in range(args.clients)
+        ]
+        try:
+            await connected.wait()
+        except asyncio.BrokenBarrierError:
+            pass
+        connect_elapsed = time.perf_counter() - started
+        # The server registers a socket only after accepting it and looking up the room.
+        deadline = time.monotonic() + 10.0
+        loaded = (await http.get("/_bench/stats")).json()
+        while loaded["connections"] < args.clients and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            loaded = (await http.get("/_bench/stats")).json()
+
+        started = time.perf_counter()
+        await asyncio.gather(*clients)
+        elapsed = time.perf_counter() - started
+        final = (await http.get("/_bench/stats")).json()
+
+    fanout = [max(r.receipts) - min(r.receipts) for r in stats.rounds.values() if len(r.receipts) > 1]
+    written = final["persisted_messages"] - baseline["persisted_messages"]
+    return {
+        "connect_seconds": round(connect_elapsed, 3),
+        "run_seconds": round(elapsed, 3),
+        "messages_sent": len(stats.rounds),
+        "frames_received": dict(stats.frames),
+        "ws_messages_received": stats.messages_received,
+        "ws_bytes_received": stats.bytes_received,
+        "client_errors": dict(stats.errors),
+        "echo_latency": percentiles(stats.echo),
+        "first_reply_latency": percentiles(stats.first_reply),
+        "reply_latency": percentiles(stats.reply),
+        "fanout_spread": percentiles(fanout),
+        "db_rows_written": written,
+        "db_rows_per_s": round(written / elapsed, 1) if elapsed else 0.0,
+        "loop_lag": final["loop_lag"],
+        "memory_per_connection_bytes": (
+            (loaded["rss_bytes"] - baseline["rss_bytes"]) // max(loaded["connections"], 1)
+        ),
+        "server_rss_bytes": final["rss_bytes"],
+        "dropped_sends": final["dropped_sends"],
+        "disconnected_slow_clients": final["disconnected_slow_clients"],
+    }
+
+
+async def wait_ready(base_url: str, server: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as http:
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise RuntimeError(f"Server exited with code {server.returncode}")
+            try:
+                await http.get("/_bench/stats")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError("Server did not start in time")
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args: argparse.Namespace):
+    base_url = f"http://127.0.0.1:{args.port}"
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite+aiosqlite:///{os.path.join(tmp, 'load.db')}",
+            "BROKER_PATH": os.path.join(tmp, "broker.db"),
+            "LLM_MODEL": "fake",
+            "TONE_MODEL": "fake",
+            "FAKE_LATENCY_DISTRIBUTION": args.latency_distribution,
+            "FAKE_LATENCY_MEAN": str(args.latency_mean),
+            "FAKE_LATENCY_JITTER": str(args.latency_jitter),
+        }
+        command = [sys.executable, "-m", "benchmarks.load", "--serve", "--port", str(args.port)]
+        if args.persona_delays:
+            command.append("--persona-delays")
+        server = subprocess.Popen(command, env=env)
+        try:
+            await wait_ready(base_url, server)
+            results = await drive(args, base_url)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    args_dict = {key: value for key, value in vars(args).items() if key not in ("serve", "output")}
+    report = json.dumps({"benchmark": "load", "commit": git_commit(), "args": args_dict, "results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    print(report)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Drive the chat WebSocket pipeline against the fake model")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--rooms", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=5, help="messages sent by each client")
+    parser.add_argument("--rate", type=float, default=0.5, help="messages per second per client")
+    parser.add_argument("--settle", type=float, default=5.0, help="seconds to keep listening after the last send")
+    parser.add_argument("--mystery", action="store_true", help="create mystery-mode rooms")
+    parser.add_argument("--persona-delays", action="store_true", help="keep the personas' typing delays")
+    parser.add_argument("--latency-distribution", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--latency-mean", type=float, default=0.5)
+    parser.add_argument("--latency-jitter", type=float, default=0.25)
+    parser.add_argument("--protocol", choices=list(SUBPROTOCOLS), default="json")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    if arguments.serve:
+        serve(arguments)
+    else:
+        asyncio.run(main(arguments))
@@ -1,5 +1,5 @@
 import { useState, useEffect, useRef } from 'react'
-import type { Room, Message, PersonaInfo } from '../types'
+import type { Room, Message, PersonaInfo, ServerFrame } from '../types'
 import WebSocketClient from '../services/websocket'
 import apiClient from '../services/api'
 import MessageList from './MessageList'
@@ -21,11 +21,25 @@ function ChatRoom({ room, onBack }: ChatRoomProps) {
   const [loading, setLoading] = useState(true)
   const [mutedPersonas, setMutedPersonas] = useState<Set<string>>(new Set())
   const [personaActivity, setPersonaActivity] = useState<Record<string, number>>({})
+  const [typing, setTyping] = useState<Record<string, { personaId: string; name: string }>>({})
   const wsClientRef = useRef<WebSocketClient | null>(null)
   const messagesEndRef = useRef<HTMLDivElement>(null)
 
   const activePersonas = Object.keys(personas).filter(id => !mutedPersonas.has(id))
   const backgroundGradient = generateDynamicGradient(activePersonas, personaActivity)
+  const typingNames = Object.values(typing)
+    .filter(({ personaId }) => !mutedPersonas.has(personaId))
+    .map(({ name }) => name)
+
+  const stopTyping = (messageId?: string) => {
+    if (!messageId) return
+    setTyping((prev) => {
+      if (!(messageId in prev)) return prev
+      const next = { ...prev }
+      delete next[messageId]
+      return next
+    })
+  }
 
   const handleToggleMute = (personaId: string) => {
     setMutedPersonas((prev) => {
@@ -71,7 +85,76 @@ function ChatRoom({ room, onBack }: ChatRoomProps) {
     wsClientRef.current = new WebSocketClient()
     wsClientRef.current.connect(
       room.id,
-      (message: Message) => {
+      (frame: ServerFrame) => {
+        switch (frame.type) {
+          case 'persona_typing':
+            setTyping((prev) => ({
+              ...prev,
+              [frame.message_id]: { personaId: frame.persona_id, name: frame.persona_name },
+            }))
+            return
+          case 'persona_message_start':
+            stopTyping(frame.message_id)
+            setMessages((prev) => [
+              ...prev,
+              {
+                type: 'persona_message',
+                message_id: frame.message_id,
+                persona_id: frame.persona_id,
+                persona_name: frame.persona_name,
+                content: '',
+                sender_type: 'persona',
+                created_at: frame.created_at,
+              },
+            ])
+            setPersonaActivity((prev) => updatePersonaActivity(prev, frame.persona_id))
+            return
+          case 'persona_message_delta':
+            setMessages((prev) =>
+              prev.map((m) =>
+                m.message_id === frame.message_id ? { ...m, content: m.content + (frame.delta ?? '') } : m
+              )
+            )
+            return
+          case 'persona_message_end':
+            setMessages((prev) =>
+              prev.map((m) =>
+                m.message_id === frame.message_id
+                  ? { ...m, id: frame.id, content: frame.content ?? m.content, created_at: frame.created_at }
+                  : m
+              )
+            )
+            return
+          case 'persona_message_cancelled':
+            stopTyping(frame.message_id)
+            setMessages((prev) => prev.filter((m) => m.message_id !== frame.message_id))
+            return
+          case 'throttled':
+            if (frame.content !== undefined) {
+              // The message was dropped; take back its optimistic copy.
+              setMessages((prev) => {
+                for (let i = prev.length - 1; i >= 0; i--) {
+                  const m = prev[i]
+                  if (m.sender_type === 'user' && m.user_id === userId && m.content === frame.content) {
+                    return prev.filter((_, j) => j !== i)
+                  }
+                }
+                return prev
+              })
+            }
+            console.warn(`Throttled (${frame.reason}), retry in ${frame.retry_after}s`)
+            return
+          case 'error':
+            stopTyping(frame.message_id)
+            if (frame.message_id) {
+              setMessages((prev) => prev.filter((m) => m.message_id !== frame.message_id))
+            }
+            console.error(frame.message)
+            return
+        }
+
+        const message = frame as Message
+        stopTyping(message.message_id)
         setMessages((prev) => {
           const lastMessage = prev[prev.length - 1]
           if (
@@ -146,6 +229,11 @@ function ChatRoom({ room, onBack }: ChatRoomProps) {
                 mutedPersonas={mutedPersonas}
                 mysteryMode={room.mystery_mode}
               />
+              {typingNames.length > 0 && (
+                <div className="typing-indicator">
+                  {room.mystery_mode ? 'Someone is typing…' : `${typingNames.join(', ')} typing…`}
+                </div>
+              )}
               <div ref={messagesEndRef} />
             </>
           )}
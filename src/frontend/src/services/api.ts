@@ -4,9 +4,18 @@ const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
 
 export class ApiClient {
   async getRooms(): Promise<Room[]> {
-    const response = await fetch(`${API_BASE_URL}/rooms`);
-    if (!response.ok) throw new Error('Failed to fetch rooms');
-    return response.json();
+    const rooms: Room[] = [];
+    let beforeId: string | null = null;
+    do {
+      const params = new URLSearchParams({ limit: '1000' });
+      if (beforeId !== null) params.set('before_id', beforeId);
+
+      const response = await fetch(`${API_BASE_URL}/rooms?${params}`);
+      if (!response.ok) throw new Error('Failed to fetch rooms');
+      rooms.push(...(await response.json()));
+      beforeId = response.headers.get('X-Next-Before-Id');
+    } while (beforeId !== null);
+    return rooms;
   }
 
   async createRoom(name: string, mysteryMode: boolean = false): Promise<Room> {
@@ -23,8 +32,17 @@ export class ApiClient {
     return response.json();
   }
 
-  async getRoomMessages(roomId: number): Promise<Message[]> {
-    const response = await fetch(`${API_BASE_URL}/rooms/${roomId}/messages`);
+  async getRoomMessages(
+    roomId: number,
+    options: { beforeId?: number; afterId?: number; limit?: number } = {}
+  ): Promise<Message[]> {
+    const params = new URLSearchParams();
+    if (options.beforeId !== undefined) params.set('before_id', String(options.beforeId));
+    if (options.afterId !== undefined) params.set('after_id', String(options.afterId));
+    if (options.limit !== undefined) params.set('limit', String(options.limit));
+
+    const query = params.toString();
+    const response = await fetch(`${API_BASE_URL}/rooms/${roomId}/messages${query ? `?${query}` : ''}`);
     if (!response.ok) throw new Error('Failed to fetch messages');
     return response.json();
   }
@@ -1,9 +1,12 @@
-import type { Message } from '../types';
+import type { ServerFrame } from '../types';
+
+// Room not found, message too big, idle timeout.
+const NO_RECONNECT_CODES = [1008, 1009, 4001];
 
 export class WebSocketClient {
   private ws: WebSocket | null = null;
   private url: string;
-  private messageHandler: ((message: Message) => void) | null = null;
+  private messageHandler: ((frame: ServerFrame) => void) | null = null;
   private disconnectHandler: (() => void) | null = null;
   private reconnectAttempts = 0;
   private maxReconnectAttempts = 5;
@@ -13,7 +16,7 @@ export class WebSocketClient {
     this.url = baseUrl;
   }
 
-  connect(roomId: number, onMessage: (message: Message) => void, onDisconnect?: () => void) {
+  connect(roomId: number, onMessage: (frame: ServerFrame) => void, onDisconnect?: () => void) {
     this.messageHandler = onMessage;
     this.disconnectHandler = onDisconnect;
 
@@ -30,8 +33,12 @@ export class WebSocketClient {
 
       this.ws.onmessage = (event) => {
         try {
-          const message: Message = JSON.parse(event.data);
-          this.messageHandler?.(message);
+          const frame = JSON.parse(event.data);
+          if (frame.type === 'ping') {
+            this.ws?.send(JSON.stringify({ type: 'pong' }));
+            return;
+          }
+          this.messageHandler?.(frame as ServerFrame);
         } catch (error) {
           console.error('Failed to parse WebSocket message:', error);
         }
@@ -41,10 +48,12 @@ export class WebSocketClient {
         console.error('WebSocket error:', error);
       };
 
-      this.ws.onclose = () => {
+      this.ws.onclose = (event) => {
         console.log('WebSocket disconnected');
         this.disconnectHandler?.();
-        this.attemptReconnect(roomId);
+        if (!NO_RECONNECT_CODES.includes(event.code)) {
+          this.attemptReconnect(roomId);
+        }
       };
     } catch (error) {
       console.error('Failed to create WebSocket:', error);
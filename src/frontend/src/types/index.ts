@@ -15,7 +15,8 @@ export interface Room {
 
 export interface Message {
   id?: number;
-  type: 'user_message' | 'persona_message' | 'error';
+  message_id?: string;
+  type: 'user_message' | 'persona_message';
   user_id?: string;
   persona_id?: string;
   persona_name?: string;
@@ -24,6 +25,52 @@ export interface Message {
   created_at?: string;
 }
 
+export interface PersonaStreamFrame {
+  type: 'persona_message_start' | 'persona_message_delta' | 'persona_message_end';
+  message_id: string;
+  id?: number;
+  persona_id: string;
+  persona_name?: string;
+  delta?: string;
+  content?: string;
+  sender_type?: 'persona';
+  created_at?: string;
+}
+
+export interface PersonaTypingFrame {
+  type: 'persona_typing';
+  message_id: string;
+  persona_id: string;
+  persona_name: string;
+}
+
+export interface PersonaCancelledFrame {
+  type: 'persona_message_cancelled';
+  message_id: string;
+  persona_id: string;
+}
+
+export interface ErrorFrame {
+  type: 'error';
+  message: string;
+  message_id?: string;
+}
+
+export interface ThrottledFrame {
+  type: 'throttled';
+  reason: 'user_rate' | 'room_rate' | 'overloaded';
+  retry_after: number;
+  content?: string;
+}
+
+export type ServerFrame =
+  | Message
+  | PersonaTypingFrame
+  | PersonaStreamFrame
+  | PersonaCancelledFrame
+  | ErrorFrame
+  | ThrottledFrame;
+
 export interface PersonaInfo {
   [key: string]: Persona;
 }